@@ -5,9 +5,24 @@ from discord.ui import Button, View, Select
 import sqlite3
 import random
 import asyncio
-from typing import List, Dict, Optional, Tuple
+import re
+import os
+import tempfile
+import json
+import hashlib
+import heapq
+import time
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Literal
 from discord.ui import View as DiscordView
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+from collections import OrderedDict, defaultdict
+from array import array
+from itertools import permutations
+import dbtool
+
+DB_PATH = 'elo_bot.db'
+BACKUP_DIR = 'backups'
 
 # Database setup and connection management
 @contextmanager
@@ -15,7 +30,7 @@ def get_db_connection():
     """Yield a database connection with proper error handling"""
     conn = None
     try:
-        conn = sqlite3.connect('elo_bot.db', timeout=10, check_same_thread=False)
+        conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
         conn.execute("PRAGMA journal_mode=WAL")  # Enable Write-Ahead Logging
         yield conn
     except sqlite3.Error as e:
@@ -37,38 +52,325 @@ def get_db_cursor():
             conn.rollback()
             raise
 
+def add_column_if_missing(c, table, column, definition):
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# Schema migrations. Each one runs once, in order, tracked by PRAGMA user_version.
+# Never edit a migration that has shipped; append a new one instead.
+def migration_1_baseline(c):
+    """Tables as they existed before versioning; safe on databases of any age"""
+    c.execute('''CREATE TABLE IF NOT EXISTS queue
+                 (user_id INTEGER PRIMARY KEY,
+                  username TEXT,
+                  queue_type TEXT)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS players
+                 (user_id INTEGER PRIMARY KEY, 
+                  username TEXT, 
+                  elo INTEGER DEFAULT 0,
+                  wins INTEGER DEFAULT 0,
+                  losses INTEGER DEFAULT 0)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS matches
+                 (match_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  team_a_players TEXT,
+                  team_b_players TEXT,
+                  winning_team TEXT,
+                  map_played TEXT,
+                  disputed BOOLEAN DEFAULT FALSE)''')
+    
+    # ELO moved per player when the match was settled, and whether it was reverted
+    add_column_if_missing(c, "matches", "elo_change", "INTEGER")
+    add_column_if_missing(c, "matches", "voided", "INTEGER DEFAULT 0")
+    add_column_if_missing(c, "matches", "dispute_message_id", "INTEGER")
+    
+    # Only open disputes are indexed, so the index stays tiny
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_matches_open_disputes ON matches (match_id)
+                 WHERE disputed=1 AND winning_team IS NULL AND voided=0''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS level_roles
+                 (level INTEGER PRIMARY KEY,
+                  role_id INTEGER)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS seasons
+                 (season_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT,
+                  started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  ended_at DATETIME)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS season_ratings
+                 (season_id INTEGER,
+                  user_id INTEGER,
+                  username TEXT,
+                  elo INTEGER,
+                  wins INTEGER,
+                  losses INTEGER,
+                  PRIMARY KEY (season_id, user_id))''')
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_season_ratings_elo ON season_ratings (season_id, elo DESC)")
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS player_map_stats
+                 (user_id INTEGER,
+                  map TEXT,
+                  wins INTEGER DEFAULT 0,
+                  losses INTEGER DEFAULT 0,
+                  PRIMARY KEY (user_id, map))''')
+    
+    # current_streak is positive for wins in a row, negative for losses
+    c.execute('''CREATE TABLE IF NOT EXISTS player_streaks
+                 (user_id INTEGER PRIMARY KEY,
+                  current_streak INTEGER DEFAULT 0,
+                  best_win_streak INTEGER DEFAULT 0,
+                  worst_loss_streak INTEGER DEFAULT 0)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS teammate_pairs
+                 (user_id INTEGER,
+                  teammate_id INTEGER,
+                  games INTEGER DEFAULT 0,
+                  wins INTEGER DEFAULT 0,
+                  PRIMARY KEY (user_id, teammate_id))''')
+    
+    # Every database starts out in its first season
+    c.execute("INSERT INTO seasons (name) SELECT 'Season 1' WHERE NOT EXISTS (SELECT 1 FROM seasons)")
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS bot_meta
+                 (key TEXT PRIMARY KEY,
+                  value TEXT)''')
+
+def migration_2_hot_query_indexes(c):
+    # Queue counts and pops filter by queue type
+    c.execute("CREATE INDEX IF NOT EXISTS idx_queue_type ON queue (queue_type)")
+    # Leaderboards read the top of the ELO ordering
+    c.execute("CREATE INDEX IF NOT EXISTS idx_players_elo ON players (elo DESC)")
+    # Replays and rebuilds stream matches in play order
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_timestamp ON matches (timestamp, match_id)")
+    # Leftover from an older schema, never read
+    c.execute("DROP TABLE IF EXISTS levels")
+
+def migration_3_map_pool(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS map_pool
+                 (guild_id INTEGER,
+                  map TEXT,
+                  weight REAL DEFAULT 1,
+                  PRIMARY KEY (guild_id, map))''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS guild_settings
+                 (guild_id INTEGER PRIMARY KEY,
+                  map_selection TEXT DEFAULT 'vote')''')
+    
+    # Last time each player played each map, looked up by (user_id, map)
+    c.execute('''CREATE TABLE IF NOT EXISTS player_recent_maps
+                 (user_id INTEGER,
+                  map TEXT,
+                  played_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  PRIMARY KEY (user_id, map))''')
+
+def migration_4_queue_join_time(c):
+    add_column_if_missing(c, "queue", "joined_at", "REAL")
+
+def migration_5_queue_parties(c):
+    add_column_if_missing(c, "queue", "party_id", "INTEGER")
+
+def migration_6_multi_queue(c):
+    # One row per (player, queue type) so a player can wait in several queues
+    c.execute('''CREATE TABLE queue_new
+                 (user_id INTEGER,
+                  username TEXT,
+                  queue_type TEXT,
+                  joined_at REAL,
+                  party_id INTEGER,
+                  PRIMARY KEY (user_id, queue_type))''')
+    c.execute('''INSERT INTO queue_new (user_id, username, queue_type, joined_at, party_id)
+                 SELECT user_id, username, queue_type, joined_at, party_id FROM queue''')
+    c.execute("DROP TABLE queue")
+    c.execute("ALTER TABLE queue_new RENAME TO queue")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_queue_type ON queue (queue_type, joined_at)")
+
+def migration_7_match_events(c):
+    # Append-only audit log. Events before a match row exists carry the
+    # match channel ID; the match_created event links it to the match ID.
+    c.execute('''CREATE TABLE IF NOT EXISTS match_events
+                 (event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  created_at REAL,
+                  event TEXT,
+                  match_id INTEGER,
+                  channel_id INTEGER,
+                  user_id INTEGER,
+                  data TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_match_events_match ON match_events (match_id) WHERE match_id IS NOT NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_match_events_channel ON match_events (channel_id) WHERE channel_id IS NOT NULL")
+
+def migration_8_match_season(c):
+    # The season a result counted toward, set when the match is settled
+    add_column_if_missing(c, "matches", "season_id", "INTEGER")
+    # Older results: best guess from the season running when the match was created.
+    # Make sure the first season exists so every settled match gets one
+    get_current_season(c)
+    c.execute('''UPDATE matches SET season_id = COALESCE(
+                     (SELECT s.season_id FROM seasons s WHERE s.started_at <= matches.timestamp
+                      ORDER BY s.season_id DESC LIMIT 1),
+                     (SELECT MIN(season_id) FROM seasons))
+                 WHERE winning_team IS NOT NULL AND season_id IS NULL''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_season ON matches (season_id, timestamp, match_id)")
+
+def migration_9_match_channels(c):
+    # Channels created for the match, so admin tools can clean them up later
+    add_column_if_missing(c, "matches", "match_channel_id", "INTEGER")
+    add_column_if_missing(c, "matches", "team_a_channel_id", "INTEGER")
+    add_column_if_missing(c, "matches", "team_b_channel_id", "INTEGER")
+
+MIGRATIONS = [
+    (1, migration_1_baseline),
+    (2, migration_2_hot_query_indexes),
+    (3, migration_3_map_pool),
+    (4, migration_4_queue_join_time),
+    (5, migration_5_queue_parties),
+    (6, migration_6_multi_queue),
+    (7, migration_7_match_events),
+    (8, migration_8_match_season),
+    (9, migration_9_match_channels),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def run_migrations(conn):
+    """Apply pending migrations in one transaction and return the schema version"""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = [(version, migrate) for version, migrate in MIGRATIONS if version > current]
+    if not pending:
+        return current
+    
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for version, migrate in pending:
+            migrate(c)
+            print(f"Applied schema migration {version}: {migrate.__name__}")
+        c.execute(f"PRAGMA user_version = {pending[-1][0]}")
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    
+    # Refresh planner statistics so the new indexes get picked up
+    conn.execute("ANALYZE")
+    return pending[-1][0]
+
 def init_db():
+    """Bring the schema up to date and clear queues left over from the last run"""
+    with get_db_connection() as conn:
+        run_migrations(conn)
+        
+        # Queue entries don't survive a restart
+        conn.execute("DELETE FROM queue")
+        conn.commit()
+        conn.execute("PRAGMA optimize")
+
+def get_meta(key):
+    with get_db_cursor() as c:
+        c.execute("SELECT value FROM bot_meta WHERE key=?", (key,))
+        row = c.fetchone()
+    return row[0] if row else None
+
+def set_meta(key, value):
     with get_db_cursor() as c:
-        # Drop old table if exists
-        c.execute("DROP TABLE IF EXISTS queue")
-        
-        # Create new tables with required columns
-        c.execute('''CREATE TABLE queue
-                     (user_id INTEGER PRIMARY KEY,
-                      username TEXT,
-                      queue_type TEXT)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS players
-                     (user_id INTEGER PRIMARY KEY, 
-                      username TEXT, 
-                      elo INTEGER DEFAULT 0,
-                      wins INTEGER DEFAULT 0,
-                      losses INTEGER DEFAULT 0)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS matches
-                     (match_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                      team_a_players TEXT,
-                      team_b_players TEXT,
-                      winning_team TEXT,
-                      map_played TEXT,
-                      disputed BOOLEAN DEFAULT FALSE)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS level_roles
-                     (level INTEGER PRIMARY KEY,
-                      role_id INTEGER)''')
-
-init_db()
+        c.execute("INSERT OR REPLACE INTO bot_meta (key, value) VALUES (?, ?)", (key, value))
+
+# Player snapshot cache
+PLAYER_CACHE_SIZE = 10000
+
+class PlayerRecord:
+    __slots__ = ("user_id", "username", "elo", "wins", "losses")
+
+    def __init__(self, user_id, username, elo, wins, losses):
+        self.user_id = user_id
+        self.username = username
+        self.elo = elo
+        self.wins = wins
+        self.losses = losses
+
+
+class PlayerCache:
+    """Write-through LRU cache of player rows keyed by user_id"""
+
+    def __init__(self, max_size=PLAYER_CACHE_SIZE):
+        self.max_size = max_size
+        self._records: "OrderedDict[int, PlayerRecord]" = OrderedDict()
+        # True while every players row is held in memory, so a miss
+        # means the player isn't registered and needs no disk read
+        self.complete = False
+
+    def warm(self):
+        with get_db_cursor() as c:
+            c.execute(
+                "SELECT user_id, username, elo, wins, losses FROM players ORDER BY elo DESC LIMIT ?",
+                (self.max_size + 1,)
+            )
+            rows = c.fetchall()
+
+        self._records.clear()
+        for row in rows[:self.max_size]:
+            self._records[row[0]] = PlayerRecord(*row)
+        self.complete = len(rows) <= self.max_size
+
+    def _store(self, record: PlayerRecord):
+        self._records[record.user_id] = record
+        self._records.move_to_end(record.user_id)
+        if len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+            self.complete = False
+
+    def get(self, user_id: int) -> Optional[PlayerRecord]:
+        record = self._records.get(user_id)
+        if record is not None:
+            self._records.move_to_end(user_id)
+            return record
+        if self.complete:
+            return None
+
+        with get_db_cursor() as c:
+            c.execute("SELECT user_id, username, elo, wins, losses FROM players WHERE user_id=?", (user_id,))
+            row = c.fetchone()
+        if not row:
+            return None
+
+        record = PlayerRecord(*row)
+        self._store(record)
+        return record
+
+    def put(self, user_id, username, elo, wins, losses):
+        self._store(PlayerRecord(user_id, username, elo, wins, losses))
+
+    def refresh(self, rows):
+        """Store freshly read (user_id, username, elo, wins, losses) rows"""
+        for row in rows:
+            self._store(PlayerRecord(*row))
+
+    def invalidate(self, user_ids):
+        user_ids = list(user_ids)
+        if len(user_ids) > 500:
+            self.warm()
+            return
+        for user_id in user_ids:
+            self._records.pop(user_id, None)
+
+        # Reload right away while complete so misses stay authoritative
+        if self.complete and user_ids:
+            placeholders = ",".join("?" * len(user_ids))
+            try:
+                with get_db_cursor() as c:
+                    c.execute(
+                        f"SELECT user_id, username, elo, wins, losses FROM players WHERE user_id IN ({placeholders})",
+                        user_ids
+                    )
+                    self.refresh(c.fetchall())
+            except sqlite3.Error as e:
+                print(f"Error reloading cached players: {e}")
+                self.complete = False
+
+player_cache = PlayerCache()
 
 # Queue types configuration
 QUEUE_TYPES = {
@@ -97,7 +399,806 @@ ADMIN_RESULTS_CHANNEL = 1398642394257428522
 ADMIN_CHANNEL = 1397957346604351508
 LEADERBOARD_CHANNEL = 1397979720645349549
 
-class QueueSelectView(View):
+# ELO gained by each winner and lost by each loser
+ELO_CHANGE = 25
+
+# Season soft reset: new_elo = base + (elo - base) * keep
+SEASON_RESET_BASE = 0
+SEASON_RESET_KEEP = 0.5
+
+# Queue entries older than this many seconds are dropped
+QUEUE_ENTRY_TTL = 30 * 60
+QUEUE_SWEEP_INTERVAL = 30
+# Drop queued players who disconnect from voice
+EVICT_ON_VOICE_LEAVE = False
+# Drop queued players who go offline; needs the privileged presences intent
+EVICT_ON_OFFLINE = False
+# Per-user token buckets: action -> (burst, tokens regained per second).
+# Actions are component custom IDs, "/<command>" for slash commands, or
+# "component" for any other button or select.
+THROTTLE_RATES = {
+    "join_queue": (3, 0.2),
+    "leave_queue": (3, 0.2),
+    "component": (5, 1.0),
+}
+THROTTLE_DEFAULT = (4, 0.5)
+THROTTLE_SWEEP_INTERVAL = 60
+# Live queue messages kept up to date per guild and queue type
+QUEUE_BOARDS_PER_TYPE = 3
+# Names listed on a queue board before the rest are summarized
+QUEUE_BOARD_NAMES = 25
+# Parties can't be bigger than the largest team
+MAX_PARTY_SIZE = max(q["team_size"] for q in QUEUE_TYPES.values())
+PARTY_INVITE_TIMEOUT = 60
+# Ask every player to confirm before a full queue pops
+READY_CHECK_ENABLED = True
+READY_CHECK_TIMEOUT = 30
+
+# Map pool used by guilds that haven't configured their own
+DEFAULT_MAPS = ["Urban", "Air Force", "Sandstorm", "Rampage", "District", "Iraq", "Morocco"]
+# Maps offered in a map vote
+MAP_VOTE_CANDIDATES = 4
+# A map's weight is multiplied by this for each player who played it recently
+RECENT_MAP_PENALTY = 0.5
+RECENT_MAP_HOURS = 24
+
+# Captain draft: "snake" picks A, B, B, A, A, ...; "alternate" picks A, B, A, B, ...
+DRAFT_ORDER = "snake"
+DRAFT_PICK_TIMEOUT = 60
+
+# Seconds between member edits while resyncing level roles
+ROLE_SYNC_INTERVAL = 0.5
+
+# Match event journal: batches are written after this many seconds, in one transaction
+JOURNAL_FLUSH_DELAY = 0.005
+JOURNAL_MAX_BATCH = 500
+
+# Members fetched over HTTP when they aren't in the gateway cache
+MEMBER_FETCH_CACHE_SIZE = 500
+MEMBER_FETCH_TTL = 10 * 60
+
+def get_level(elo):
+    """Return the level for an ELO value, 0 if below every threshold"""
+    current_level = 0
+    for level, data in ELO_LEVELS.items():
+        if elo >= data["min_elo"]:
+            current_level = level
+    return current_level
+
+def get_current_season(c):
+    c.execute("SELECT season_id, name FROM seasons WHERE ended_at IS NULL ORDER BY season_id DESC LIMIT 1")
+    row = c.fetchone()
+    if row:
+        return row
+    c.execute("INSERT INTO seasons (name) VALUES ('Season 1')")
+    return c.lastrowid, "Season 1"
+
+def rollover_season(name=None):
+    """Archive the current season and soft reset every player in one transaction.
+
+    Returns the ended season name, the new season ID and a list of
+    (user_id, new_elo) for players whose level changed.
+    """
+    with get_db_cursor() as c:
+        season_id, season_name = get_current_season(c)
+        
+        c.execute(
+            """INSERT OR REPLACE INTO season_ratings (season_id, user_id, username, elo, wins, losses)
+               SELECT ?, user_id, username, elo, wins, losses FROM players""",
+            (season_id,)
+        )
+        c.execute("UPDATE seasons SET ended_at=CURRENT_TIMESTAMP WHERE season_id=?", (season_id,))
+        c.execute(
+            "UPDATE players SET elo=CAST(ROUND(? + (elo - ?) * ?) AS INTEGER), wins=0, losses=0",
+            (SEASON_RESET_BASE, SEASON_RESET_BASE, SEASON_RESET_KEEP)
+        )
+        c.execute("INSERT INTO seasons (name) VALUES (?)", (name or f"Season {season_id + 1}",))
+        new_season_id = c.lastrowid
+        
+        c.execute(
+            """SELECT s.user_id, s.elo, p.elo FROM season_ratings s
+               JOIN players p ON p.user_id = s.user_id
+               WHERE s.season_id=?""",
+            (season_id,)
+        )
+        changes = [
+            (user_id, new_elo) for user_id, old_elo, new_elo in c.fetchall()
+            if get_level(old_elo) != get_level(new_elo)
+        ]
+    
+    return season_name, new_season_id, changes
+
+def parse_roster(text):
+    """Return the player IDs stored in a matches team column"""
+    if not text:
+        return []
+    return [int(p) for p in re.split(r"[,;]", text) if p.strip()]
+
+ADJUSTMENT_PATTERN = re.compile(r"(?:<@!?(\d+)>|(\d{5,}))\s*:?\s*([+=-])\s*(\d+)")
+
+def parse_adjustments(text):
+    """Parse "@user +25, 1234:-10, @other =300" into (user_id, op, value) tuples"""
+    return [
+        (int(mention or raw_id), op, int(value))
+        for mention, raw_id, op, value in ADJUSTMENT_PATTERN.findall(text)
+    ]
+
+def apply_rating_adjustments(adjustments):
+    """Apply every adjustment in one transaction.
+
+    Returns (user_id, old_elo, new_elo) for each adjusted player and the
+    IDs that have no players row.
+    """
+    user_ids = list(dict.fromkeys(user_id for user_id, _, _ in adjustments))
+    if not user_ids:
+        return [], []
+    
+    with get_db_cursor() as c:
+        placeholders = ",".join("?" * len(user_ids))
+        c.execute(f"SELECT user_id, elo FROM players WHERE user_id IN ({placeholders})", user_ids)
+        old_elos = dict(c.fetchall())
+        
+        new_elos = dict(old_elos)
+        for user_id, op, value in adjustments:
+            if user_id not in new_elos:
+                continue
+            if op == "=":
+                new_elos[user_id] = value
+            else:
+                new_elos[user_id] += value if op == "+" else -value
+        
+        c.executemany("UPDATE players SET elo=? WHERE user_id=?", [(elo, user_id) for user_id, elo in new_elos.items()])
+    
+    changes = [(user_id, old_elos[user_id], new_elos[user_id]) for user_id in user_ids if user_id in old_elos]
+    missing = [user_id for user_id in user_ids if user_id not in old_elos]
+    return changes, missing
+
+def revert_match(match_id):
+    """Undo a match's ELO and W/L changes and mark it voided, in one transaction.
+
+    Returns (user_id, old_elo, new_elo) for each player in the match.
+    Raises ValueError if the match doesn't exist, was already voided or
+    was settled in an earlier season, whose ratings have been archived.
+    """
+    with get_db_cursor() as c:
+        c.execute(
+            "SELECT team_a_players, team_b_players, winning_team, elo_change, voided, map_played, season_id FROM matches WHERE match_id=?",
+            (match_id,)
+        )
+        row = c.fetchone()
+        if not row:
+            raise ValueError(f"Match {match_id} not found.")
+        team_a_players, team_b_players, winning_team, elo_change, voided, map_played, season_id = row
+        if voided:
+            raise ValueError(f"Match {match_id} was already reverted.")
+        if winning_team in ("A", "B") and season_id != get_current_season(c)[0]:
+            raise ValueError(f"Match {match_id} was settled in an earlier season and can't be reverted.")
+        
+        c.execute("UPDATE matches SET voided=1 WHERE match_id=?", (match_id,))
+        if winning_team not in ("A", "B"):
+            return []
+        
+        team_a, team_b = parse_roster(team_a_players), parse_roster(team_b_players)
+        winners = team_a if winning_team == "A" else team_b
+        losers = team_b if winning_team == "A" else team_a
+        delta = elo_change if elo_change is not None else ELO_CHANGE
+        
+        placeholders = ",".join("?" * len(winners + losers))
+        c.execute(f"SELECT user_id, elo FROM players WHERE user_id IN ({placeholders})", winners + losers)
+        old_elos = dict(c.fetchall())
+        
+        c.executemany(
+            "UPDATE players SET elo=elo+?, wins=wins-?, losses=losses-? WHERE user_id=?",
+            [(-delta, 1, 0, player_id) for player_id in winners] +
+            [(delta, 0, 1, player_id) for player_id in losers]
+        )
+        update_match_stats(c, map_played, winners, losers, sign=-1)
+    
+    return [
+        (player_id, old_elos[player_id], old_elos[player_id] + (-delta if player_id in winners else delta))
+        for player_id in winners + losers if player_id in old_elos
+    ]
+
+# Match replay and rating recomputation
+def elo_delta(winner_elos, loser_elos):
+    """Return the ELO each winner gains and each loser drops for one match"""
+    return ELO_CHANGE
+
+def iter_match_rows(conn, season_id=None, chunk_size=1000):
+    """Stream settled, non-voided matches in the order they were played.
+
+    With season_id, only matches settled during that season are included.
+    """
+    c = conn.cursor()
+    query = "SELECT match_id, team_a_players, team_b_players, winning_team, map_played FROM matches WHERE winning_team IN ('A', 'B') AND voided=0"
+    if season_id is None:
+        c.execute(query + " ORDER BY timestamp, match_id")
+    else:
+        c.execute(query + " AND season_id=? ORDER BY timestamp, match_id", (season_id,))
+    
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+def iter_match_results(rows):
+    """Turn match rows into (match_id, winners, losers, map_played)"""
+    for match_id, team_a_players, team_b_players, winning_team, map_played in rows:
+        team_a, team_b = parse_roster(team_a_players), parse_roster(team_b_players)
+        if winning_team == "A":
+            yield match_id, team_a, team_b, map_played
+        else:
+            yield match_id, team_b, team_a, map_played
+
+
+class RatingReplay:
+    """Rebuilds ELO, wins and losses from match results.
+
+    Player state lives in flat arrays indexed by a dense per-player slot,
+    so replaying a large history stays cheap in both time and memory.
+    """
+
+    def __init__(self, baseline=None):
+        self.baseline = baseline or {}
+        self.slots: Dict[int, int] = {}
+        self.user_ids = array("q")
+        self.elo = array("q")
+        self.wins = array("l")
+        self.losses = array("l")
+        self.match_ids = array("q")
+        self.match_deltas = array("l")
+
+    def _slot(self, user_id):
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = self.slots[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.elo.append(self.baseline.get(user_id, 0))
+            self.wins.append(0)
+            self.losses.append(0)
+        return slot
+
+    def apply(self, match_id, winners, losers):
+        winner_slots = [self._slot(p) for p in winners]
+        loser_slots = [self._slot(p) for p in losers]
+        elo = self.elo
+        delta = elo_delta([elo[s] for s in winner_slots], [elo[s] for s in loser_slots])
+        
+        for slot in winner_slots:
+            elo[slot] += delta
+            self.wins[slot] += 1
+        for slot in loser_slots:
+            elo[slot] -= delta
+            self.losses[slot] += 1
+        
+        self.match_ids.append(match_id)
+        self.match_deltas.append(delta)
+
+    def replay(self, results):
+        for match_id, winners, losers, _ in results:
+            self.apply(match_id, winners, losers)
+        return self
+
+    def get(self, user_id):
+        """Return the replayed (elo, wins, losses) for a player"""
+        slot = self.slots.get(user_id)
+        if slot is None:
+            return self.baseline.get(user_id, 0), 0, 0
+        return self.elo[slot], self.wins[slot], self.losses[slot]
+
+def load_replay_baseline(c):
+    """Return (season_id, baseline) for replaying the current season.
+
+    Ratings start from the previous season's archive with the soft reset
+    applied, and only results settled this season are replayed. Before the
+    first rollover season_id is None and the whole history is replayed.
+    """
+    c.execute("SELECT season_id FROM seasons WHERE ended_at IS NOT NULL ORDER BY season_id DESC LIMIT 1")
+    previous = c.fetchone()
+    if not previous:
+        return None, {}
+    
+    season_id, _ = get_current_season(c)
+    
+    c.execute(
+        "SELECT user_id, CAST(ROUND(? + (elo - ?) * ?) AS INTEGER) FROM season_ratings WHERE season_id=?",
+        (SEASON_RESET_BASE, SEASON_RESET_BASE, SEASON_RESET_KEEP, previous[0])
+    )
+    return season_id, dict(c.fetchall())
+
+def recompute_ratings(apply=False):
+    """Replay every match of the current season and diff against players.
+
+    Returns (user_id, (old elo, wins, losses), (new elo, wins, losses)) for
+    each player whose values differ. With apply=True the replayed values
+    are written back in one transaction; manual set_elo/bulk_adjust changes
+    are not part of the history and get replaced.
+    """
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        if apply:
+            # Hold the write lock so no result lands between replay and write back
+            c.execute("BEGIN IMMEDIATE")
+        try:
+            season_id, baseline = load_replay_baseline(c)
+            replay = RatingReplay(baseline).replay(iter_match_results(iter_match_rows(conn, season_id)))
+            
+            c.execute("SELECT user_id, elo, wins, losses FROM players")
+            current = {row[0]: row[1:] for row in c.fetchall()}
+            # Match participants without a players row get one, starting from zero
+            unknown = [user_id for user_id in replay.user_ids if user_id not in current]
+            current.update((user_id, (0, 0, 0)) for user_id in unknown)
+            
+            diffs = []
+            for user_id, old in current.items():
+                new = replay.get(user_id)
+                if new != old:
+                    diffs.append((user_id, old, new))
+            
+            if apply:
+                c.executemany(
+                    "INSERT OR IGNORE INTO players (user_id, username, elo, wins, losses) VALUES (?, ?, 0, 0, 0)",
+                    [(user_id, f"Unknown User {user_id}") for user_id in unknown]
+                )
+                c.executemany(
+                    "UPDATE players SET elo=?, wins=?, losses=? WHERE user_id=?",
+                    [(*new, user_id) for user_id, _, new in diffs]
+                )
+                c.executemany(
+                    "UPDATE matches SET elo_change=? WHERE match_id=?",
+                    zip(replay.match_deltas, replay.match_ids)
+                )
+                conn.commit()
+        except:
+            conn.rollback()
+            raise
+    
+    return diffs
+
+# Match settlement
+OPEN_DISPUTES_WHERE = "disputed=1 AND winning_team IS NULL AND voided=0"
+DISPUTES_PER_PAGE = 10
+# Recorded winners remembered for answering late result clicks without the DB
+SETTLED_CACHE_SIZE = 1024
+
+def player_display_name(guild, player_id, names=None):
+    """Name for a player without any API calls; names holds ones resolved up front"""
+    if names and player_id in names:
+        return names[player_id]
+    cached = player_cache.get(player_id)
+    if cached:
+        return cached.username
+    member = bot.members.cached(guild, player_id) if guild else None
+    return str(member) if member else f"Unknown User {player_id}"
+
+def settle_match(c, match_id, winning_team, team_a, team_b, guild=None, names=None):
+    """Record a result and apply ELO and W/L with an open cursor.
+
+    names maps player IDs to names for players who have no row yet.
+    Returns (delta, map_played, player_rows), or None when the match is
+    unknown, voided or already has a result. The caller owns the transaction.
+    """
+    # Claim the result first: the conditional UPDATE takes the write lock,
+    # so of several concurrent settlements exactly one sees a changed row.
+    # The result counts toward the season running now, not when the match began
+    season_id, _ = get_current_season(c)
+    c.execute(
+        "UPDATE matches SET winning_team=?, season_id=? WHERE match_id=? AND winning_team IS NULL AND voided=0",
+        (winning_team, season_id, match_id)
+    )
+    if c.rowcount == 0:
+        return None
+    c.execute("SELECT map_played FROM matches WHERE match_id=?", (match_id,))
+    map_played = c.fetchone()[0]
+    
+    # Determine winners and losers
+    winners = team_a if winning_team == "A" else team_b
+    losers = team_b if winning_team == "A" else team_a
+    
+    # Make sure every player has a row, then update ELO and stats
+    c.executemany(
+        "INSERT OR IGNORE INTO players (user_id, username, elo, wins, losses) VALUES (?, ?, 0, 0, 0)",
+        [(player_id, player_display_name(guild, player_id, names)) for player_id in winners + losers]
+    )
+    
+    placeholders = ",".join("?" * len(winners + losers))
+    c.execute(f"SELECT user_id, elo FROM players WHERE user_id IN ({placeholders})", winners + losers)
+    elos = dict(c.fetchall())
+    delta = elo_delta([elos[p] for p in winners], [elos[p] for p in losers])
+    
+    c.execute("UPDATE matches SET elo_change=? WHERE match_id=?", (delta, match_id))
+    c.executemany(
+        "UPDATE players SET elo=elo+?, wins=wins+?, losses=losses+? WHERE user_id=?",
+        [(delta, 1, 0, player_id) for player_id in winners] +
+        [(-delta, 0, 1, player_id) for player_id in losers]
+    )
+    
+    update_match_stats(c, map_played, winners, losers)
+    
+    c.execute(
+        f"SELECT user_id, username, elo, wins, losses FROM players WHERE user_id IN ({placeholders})",
+        winners + losers
+    )
+    return delta, map_played, c.fetchall()
+
+class SettlementLedger:
+    """Per-match locks and a bounded cache of recorded winners.
+
+    The lock keeps concurrent clicks on one match from interleaving their
+    follow-up work; the cache lets every click after the first be answered
+    straight away.
+    """
+
+    def __init__(self, capacity=SETTLED_CACHE_SIZE):
+        self.capacity = capacity
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._winners: OrderedDict = OrderedDict()
+
+    def winner(self, match_id):
+        return self._winners.get(match_id)
+
+    def remember(self, match_id, winning_team):
+        self._winners[match_id] = winning_team
+        self._winners.move_to_end(match_id)
+        while len(self._winners) > self.capacity:
+            self._winners.popitem(last=False)
+
+    @asynccontextmanager
+    async def lock(self, match_id):
+        lock = self._locks.setdefault(match_id, asyncio.Lock())
+        try:
+            async with lock:
+                yield
+        finally:
+            # Once the winner is cached, later clicks never reach the lock
+            if match_id in self._winners and not lock.locked():
+                self._locks.pop(match_id, None)
+
+def recorded_winner(match_id):
+    with get_db_cursor() as c:
+        c.execute("SELECT winning_team FROM matches WHERE match_id=?", (match_id,))
+        row = c.fetchone()
+    return row[0] if row else None
+
+def apply_settlement_side_effects(guild, player_rows):
+    """Refresh cached players and queue level roles after a settlement commits.
+
+    Every player is queued; the role sync skips members whose roles already match.
+    """
+    player_cache.refresh(player_rows)
+    for user_id, _, elo, _, _ in player_rows:
+        bot.role_sync.enqueue(guild.id, user_id, elo)
+
+def build_result_embed(match_id, winning_team, map_played, delta, team_a, team_b, player_rows):
+    players = {row[0]: row for row in player_rows}
+    winners = team_a if winning_team == "A" else team_b
+    
+    embed = discord.Embed(
+        title="🏆 Match Results",
+        description=f"Match ID: {match_id}",
+        color=0x00ff00
+    )
+    
+    embed.add_field(
+        name=f"Team {winning_team} Won",
+        value=f"**Map:** {map_played}",
+        inline=False
+    )
+    
+    # Team text with ELO changes
+    for name, team in (("Team A", team_a), ("Team B", team_b)):
+        team_text = []
+        for p in team:
+            if p in players:
+                _, username, elo, _, _ = players[p]
+                change = f"+{delta}" if p in winners else f"-{delta}"
+                team_text.append(f"{username} - {elo} ({change})")
+        embed.add_field(name=name, value="\n".join(team_text) or "\u200b", inline=True)
+    
+    return embed
+
+def parse_resolutions(text):
+    """Parse "12:A 15:B 18:void" into (match_id, outcome) tuples"""
+    return [
+        (int(match_id), outcome.upper() if outcome.upper() in ("A", "B") else "void")
+        for match_id, outcome in re.findall(r"(\d+)\s*[:=]\s*(A|B|void)\b", text, re.IGNORECASE)
+    ]
+
+def load_dispute_rosters(match_ids):
+    """Return the player IDs of the open disputes among match_ids"""
+    if not match_ids:
+        return []
+    with get_db_cursor() as c:
+        c.execute(
+            f"""SELECT team_a_players, team_b_players FROM matches
+                WHERE match_id IN ({",".join("?" * len(match_ids))}) AND {OPEN_DISPUTES_WHERE}""",
+            match_ids
+        )
+        return [p for team_a, team_b in c.fetchall() for p in parse_roster(team_a) + parse_roster(team_b)]
+
+def resolve_disputes(resolutions, guild=None, names=None):
+    """Settle or void many open disputes in one transaction.
+
+    Returns (match_id, outcome, team_a, team_b, settlement, channel_ids,
+    dispute_message_id) per entry; outcome is "skipped" for matches that
+    aren't open disputes.
+    """
+    results = []
+    with get_db_cursor() as c:
+        for match_id, outcome in resolutions:
+            c.execute(
+                f"""SELECT team_a_players, team_b_players, match_channel_id, team_a_channel_id, team_b_channel_id,
+                           dispute_message_id
+                    FROM matches WHERE match_id=? AND {OPEN_DISPUTES_WHERE}""",
+                (match_id,)
+            )
+            row = c.fetchone()
+            if not row:
+                results.append((match_id, "skipped", [], [], None, [], None))
+                continue
+            
+            team_a, team_b = parse_roster(row[0]), parse_roster(row[1])
+            channel_ids = [channel_id for channel_id in row[2:5] if channel_id]
+            if outcome == "void":
+                c.execute("UPDATE matches SET voided=1 WHERE match_id=?", (match_id,))
+                results.append((match_id, outcome, team_a, team_b, None, channel_ids, row[5]))
+            else:
+                settlement = settle_match(c, match_id, outcome, team_a, team_b, guild, names)
+                if settlement:
+                    results.append((match_id, outcome, team_a, team_b, settlement, channel_ids, row[5]))
+                else:
+                    results.append((match_id, "skipped", team_a, team_b, None, [], None))
+    return results
+
+def load_open_disputes(page=1):
+    """Return (total, page, rows) with page clamped to the pages that exist"""
+    with get_db_cursor() as c:
+        c.execute(f"SELECT COUNT(*) FROM matches WHERE {OPEN_DISPUTES_WHERE}")
+        total = c.fetchone()[0]
+        pages = max((total + DISPUTES_PER_PAGE - 1) // DISPUTES_PER_PAGE, 1)
+        page = min(max(page, 1), pages)
+        c.execute(
+            f"""SELECT match_id, timestamp, map_played, team_a_players, team_b_players FROM matches
+                WHERE {OPEN_DISPUTES_WHERE} ORDER BY match_id LIMIT ? OFFSET ?""",
+            (DISPUTES_PER_PAGE, (page - 1) * DISPUTES_PER_PAGE)
+        )
+        return total, page, c.fetchall()
+
+# Statistics aggregates
+def update_match_stats(c, map_played, winners, losers, sign=1):
+    """Fold one result into the stats tables with an open cursor.
+
+    sign=-1 takes a reverted result back out of the map and teammate
+    totals and replays the players' streaks from history, so the match
+    must already be voided.
+    """
+    if map_played:
+        c.executemany(
+            """INSERT INTO player_map_stats (user_id, map, wins, losses) VALUES (?, ?, ?, ?)
+               ON CONFLICT (user_id, map) DO UPDATE SET
+                   wins=wins+excluded.wins, losses=losses+excluded.losses""",
+            [(p, map_played, sign, 0) for p in winners] + [(p, map_played, 0, sign) for p in losers]
+        )
+    
+    c.executemany(
+        """INSERT INTO teammate_pairs (user_id, teammate_id, games, wins) VALUES (?, ?, ?, ?)
+           ON CONFLICT (user_id, teammate_id) DO UPDATE SET
+               games=games+excluded.games, wins=wins+excluded.wins""",
+        [(a, b, sign, sign) for a, b in permutations(winners, 2)] +
+        [(a, b, sign, 0) for a, b in permutations(losers, 2)]
+    )
+    
+    if sign > 0:
+        # SET expressions all see the row as it was before this update
+        c.executemany(
+            """INSERT INTO player_streaks (user_id, current_streak, best_win_streak, worst_loss_streak)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT (user_id) DO UPDATE SET
+                   current_streak=CASE WHEN excluded.current_streak > 0
+                       THEN MAX(current_streak, 0) + 1 ELSE MIN(current_streak, 0) - 1 END,
+                   best_win_streak=CASE WHEN excluded.current_streak > 0
+                       THEN MAX(best_win_streak, MAX(current_streak, 0) + 1) ELSE best_win_streak END,
+                   worst_loss_streak=CASE WHEN excluded.current_streak < 0
+                       THEN MAX(worst_loss_streak, MAX(-current_streak, 0) + 1) ELSE worst_loss_streak END""",
+            [(p, 1, 1, 0) for p in winners] + [(p, -1, 0, 1) for p in losers]
+        )
+    else:
+        # Streaks can't be unwound one result at a time, so replay them
+        if map_played:
+            c.executemany(
+                "DELETE FROM player_map_stats WHERE user_id=? AND map=? AND wins=0 AND losses=0",
+                [(p, map_played) for p in winners + losers]
+            )
+        c.executemany(
+            "DELETE FROM teammate_pairs WHERE user_id=? AND teammate_id=? AND games=0",
+            list(permutations(winners, 2)) + list(permutations(losers, 2))
+        )
+        c.executemany(
+            "INSERT OR REPLACE INTO player_streaks (user_id, current_streak, best_win_streak, worst_loss_streak) VALUES (?, ?, ?, ?)",
+            [(user_id, *streak) for user_id, streak in replay_streaks(c.connection, winners + losers).items()]
+        )
+
+# Changes whenever a match is settled, voided or reverted, but not on other writes
+SETTLED_MATCHES_CHECKSUM = """SELECT COUNT(*), TOTAL(match_id * (CASE winning_team WHEN 'A' THEN 1 ELSE 2 END))
+                              FROM matches WHERE winning_team IN ('A', 'B') AND voided=0"""
+REBUILD_STATS_ATTEMPTS = 3
+
+def fold_streak(streak, won):
+    """Advance a [current, best win, worst loss] streak by one result"""
+    if won:
+        streak[0] = max(streak[0], 0) + 1
+        streak[1] = max(streak[1], streak[0])
+    else:
+        streak[0] = min(streak[0], 0) - 1
+        streak[2] = max(streak[2], -streak[0])
+
+def replay_streaks(conn, user_ids):
+    """Recompute the streaks of a few players from match history"""
+    streaks = {user_id: [0, 0, 0] for user_id in user_ids}
+    for _, winners, losers, _ in iter_match_results(iter_match_rows(conn)):
+        for team, won in ((winners, True), (losers, False)):
+            for p in team:
+                if p in streaks:
+                    fold_streak(streaks[p], won)
+    return streaks
+
+def aggregate_match_stats(conn):
+    """Fold match history into (map_stats, pairs, streaks) dicts"""
+    map_stats: Dict[Tuple[int, str], List[int]] = {}
+    pairs: Dict[Tuple[int, int], List[int]] = {}
+    streaks: Dict[int, List[int]] = {}
+    
+    for _, winners, losers, map_played in iter_match_results(iter_match_rows(conn)):
+        for team, won in ((winners, 1), (losers, 0)):
+            for p in team:
+                if map_played:
+                    stats = map_stats.setdefault((p, map_played), [0, 0])
+                    stats[0 if won else 1] += 1
+                
+                fold_streak(streaks.setdefault(p, [0, 0, 0]), won)
+            
+            for pair in permutations(team, 2):
+                totals = pairs.setdefault(pair, [0, 0])
+                totals[0] += 1
+                totals[1] += won
+    
+    return map_stats, pairs, streaks
+
+def rebuild_stats():
+    """Recompute every stats table from match history.
+
+    History is aggregated inside a read transaction, which doesn't block
+    writers under WAL. The write lock is only held for the table swap, and
+    if a match was settled in between, the aggregation is redone.
+    """
+    with get_db_connection() as conn:
+        for _ in range(REBUILD_STATS_ATTEMPTS):
+            conn.execute("BEGIN")
+            try:
+                checksum = conn.execute(SETTLED_MATCHES_CHECKSUM).fetchone()
+                map_stats, pairs, streaks = aggregate_match_stats(conn)
+            finally:
+                conn.rollback()
+            
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                if c.execute(SETTLED_MATCHES_CHECKSUM).fetchone() != checksum:
+                    conn.rollback()
+                    continue
+                
+                c.execute("DELETE FROM player_map_stats")
+                c.execute("DELETE FROM teammate_pairs")
+                c.execute("DELETE FROM player_streaks")
+                c.executemany(
+                    "INSERT INTO player_map_stats (user_id, map, wins, losses) VALUES (?, ?, ?, ?)",
+                    ((user_id, map_played, wins, losses) for (user_id, map_played), (wins, losses) in map_stats.items())
+                )
+                c.executemany(
+                    "INSERT INTO teammate_pairs (user_id, teammate_id, games, wins) VALUES (?, ?, ?, ?)",
+                    ((a, b, games, wins) for (a, b), (games, wins) in pairs.items())
+                )
+                c.executemany(
+                    "INSERT INTO player_streaks (user_id, current_streak, best_win_streak, worst_loss_streak) VALUES (?, ?, ?, ?)",
+                    ((user_id, *streak) for user_id, streak in streaks.items())
+                )
+                conn.commit()
+            except:
+                conn.rollback()
+                raise
+            return len(streaks)
+    
+    raise sqlite3.OperationalError("Matches kept being settled during the stats rebuild; try again")
+
+def load_player_stats(user_id):
+    """Return (streak row, top maps, top teammates) for one player"""
+    with get_db_cursor() as c:
+        c.execute(
+            "SELECT current_streak, best_win_streak, worst_loss_streak FROM player_streaks WHERE user_id=?",
+            (user_id,)
+        )
+        streak = c.fetchone()
+        c.execute(
+            "SELECT map, wins, losses FROM player_map_stats WHERE user_id=? AND wins + losses > 0 ORDER BY wins + losses DESC LIMIT 5",
+            (user_id,)
+        )
+        maps = c.fetchall()
+        c.execute(
+            "SELECT teammate_id, games, wins FROM teammate_pairs WHERE user_id=? AND games > 0 ORDER BY games DESC LIMIT 5",
+            (user_id,)
+        )
+        teammates = c.fetchall()
+    return streak, maps, teammates
+
+def queue_level_changes(guild, changes):
+    """Invalidate cached players and queue role updates for level changes only"""
+    player_cache.invalidate([user_id for user_id, _, _ in changes])
+    
+    queued = 0
+    for user_id, old_elo, new_elo in changes:
+        if get_level(old_elo) != get_level(new_elo):
+            bot.role_sync.enqueue(guild.id, user_id, new_elo)
+            queued += 1
+    return queued
+
+# Interaction throttling
+class Throttle:
+    """Token buckets keyed by (user_id, action).
+
+    A bucket is stored as (tokens, last update) and only while it isn't
+    full; a missing bucket means a full one, so sweep() can drop every
+    bucket that has refilled.
+    """
+
+    def __init__(self, rates=THROTTLE_RATES, default=THROTTLE_DEFAULT):
+        self.rates = rates
+        self.default = default
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+
+    def allow(self, user_id, action, now=None):
+        now = now or time.monotonic()
+        capacity, refill = self.rates.get(action, self.default)
+        key = (user_id, action)
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    def sweep(self, now=None):
+        now = now or time.monotonic()
+        full = []
+        for key, (tokens, updated) in self._buckets.items():
+            capacity, refill = self.rates.get(key[1], self.default)
+            if tokens + (now - updated) * refill >= capacity:
+                full.append(key)
+        for key in full:
+            del self._buckets[key]
+        return len(full)
+
+async def throttled(interaction: discord.Interaction, action):
+    """Reply and return True when the user is over their rate for action"""
+    if bot.throttle.allow(interaction.user.id, action):
+        return False
+    await interaction.response.send_message("You're doing that too fast. Try again in a moment.", ephemeral=True)
+    return True
+
+class ThrottledView(View):
+    """View whose components are rate limited per user before any callback runs"""
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        custom_id = interaction.data.get("custom_id")
+        action = custom_id if custom_id in THROTTLE_RATES else "component"
+        return not await throttled(interaction, action)
+
+class ThrottledCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.type is not discord.InteractionType.application_command:
+            return True
+        return not await throttled(interaction, f"/{interaction.data.get('name')}")
+
+class QueueSelectView(ThrottledView):
     def __init__(self, bot):
         super().__init__(timeout=None)
         self.bot = bot
@@ -130,92 +1231,189 @@ class QueueSelectView(View):
         view = MatchmakingView(self.bot, queue_type)
         await interaction.response.send_message(embed=embed, view=view)
         view.queue_message = await interaction.original_response()
-        await view.update_queue_embed()
+        await self.bot.queue_boards.track(interaction.guild.id, view)
 
 
-class MatchmakingView(View):
+class MatchmakingView(ThrottledView):
     def __init__(self, bot, queue_type="4v4"):
         super().__init__(timeout=None)
         self.bot = bot
         self.queue_type = queue_type
         self.queue_message = None
     
-    async def update_queue_embed(self):
-        try:
-            with get_db_cursor() as c:
-                c.execute("SELECT COUNT(*) FROM queue WHERE queue_type=?", (self.queue_type,))
-                queue_size = c.fetchone()[0]
-                required = QUEUE_TYPES[self.queue_type]["total_players"]
-                
-                c.execute("SELECT username FROM queue WHERE queue_type=?", (self.queue_type,))
-                players = c.fetchall()
-                player_list = "\n".join([f"• {p[0]}" for p in players]) if players else "No players yet"
-        except sqlite3.Error as e:
-            print(f"Error updating queue embed: {e}")
+    @discord.ui.button(label="Join Queue", style=discord.ButtonStyle.green, custom_id="join_queue")
+    async def join_queue(self, interaction: discord.Interaction, button: Button):
+        parties = self.bot.parties
+        party_id = parties.party_of(interaction.user.id)
+        member_ids = parties.members(party_id) if party_id else [interaction.user.id]
+        
+        if party_id and member_ids[0] != interaction.user.id:
+            await interaction.response.send_message("Only your party leader can queue the party.", ephemeral=True)
+            return
+        if len(member_ids) > QUEUE_TYPES[self.queue_type]["team_size"]:
+            await interaction.response.send_message(
+                f"Your party has {len(member_ids)} players, too many for {self.queue_type}.", ephemeral=True
+            )
             return
         
-        embed = discord.Embed(
-            title=f"⚔️ {self.queue_type} Matchmaking Queue",
-            description=f"**Status:** {queue_size}/{required} players ready",
-            color=discord.Color.green() if queue_size >= required else discord.Color.orange()
-        )
-        embed.add_field(name="Players in queue:", value=player_list, inline=False)
-        embed.set_footer(text=f"Queue type: {self.queue_type} | Use buttons to join/leave")
+        # Interactions carry the full member, so queued players are cached for free
+        self.bot.members.remember(interaction.user)
+        names = {interaction.user.id: str(interaction.user)}
+        if party_id:
+            names.update(await self.bot.members.display_names(interaction.guild, member_ids))
         
-        if self.queue_message:
-            try:
-                await self.queue_message.edit(embed=embed, view=self)
-            except Exception as e:
-                print(f"Error updating queue message: {e}")
-    
-    @discord.ui.button(label="Join Queue", style=discord.ButtonStyle.green, custom_id="join_queue")
-    async def join_queue(self, interaction: discord.Interaction, button: Button):
         try:
             with get_db_cursor() as c:
-                # Remove player from all queues first
-                c.execute("DELETE FROM queue WHERE user_id=?", (interaction.user.id,))
+                # Re-joining refreshes the spot; other queues are left alone
+                c.executemany(
+                    "DELETE FROM queue WHERE user_id=? AND queue_type=?",
+                    [(p, self.queue_type) for p in member_ids]
+                )
                 
-                # Add player to this queue
-                c.execute("INSERT INTO queue (user_id, username, queue_type) VALUES (?, ?, ?)",
-                          (interaction.user.id, str(interaction.user), self.queue_type))
+                # Add them to this queue as one unit
+                joined_at = time.time()
+                c.executemany(
+                    "INSERT INTO queue (user_id, username, queue_type, joined_at, party_id) VALUES (?, ?, ?, ?, ?)",
+                    [(p, player_display_name(interaction.guild, p, names), self.queue_type, joined_at, party_id) for p in member_ids]
+                )
         except sqlite3.Error as e:
             print(f"Database error in join_queue: {e}")
             await interaction.response.send_message("Error joining queue. Please try again.", ephemeral=True)
             return
         
-        await self.update_queue_embed()
-        await interaction.response.send_message(f"You joined {self.queue_type} queue!", ephemeral=True)
+        self.bot.journal.record(
+            "queue_join", user_id=interaction.user.id, queue_type=self.queue_type, party=member_ids if party_id else None
+        )
+        for player_id in member_ids:
+            self.bot.queue_expiry.forget(player_id, self.queue_type)
+            self.bot.queue_expiry.track(player_id, self.queue_type, joined_at)
+        self.bot.queue_boards.mark([self.queue_type])
+        joined = "Your party joined" if party_id else "You joined"
+        message = f"{joined} {self.queue_type} queue!"
+        others = [qt for qt in self.bot.queue_expiry.queued(interaction.user.id) if qt != self.queue_type]
+        if others:
+            message += f" Also queued for: {', '.join(others)}."
+        await interaction.response.send_message(message, ephemeral=True)
         
-        # Check if queue is full and start match
+        # Pop matches while whole teams can be formed. Joins that arrive during
+        # a ready check leave their pop to this loop, so it re-picks after every
+        # pop or failed pop. Only players who confirmed are popped, and each
+        # failed check evicts someone.
         try:
-            with get_db_cursor() as c:
-                c.execute("SELECT COUNT(*) FROM queue WHERE queue_type=?", (self.queue_type,))
-                queue_size = c.fetchone()[0]
+            confirmed = set()
+            # Seconds spent in ready checks since the last pop, logged with the next one
+            ready_check_time = 0.0
+            while True:
+                with get_db_cursor() as c:
+                    pick = self.pick_match(c)
+                if not pick:
+                    return
                 
-            if queue_size >= QUEUE_TYPES[self.queue_type]["total_players"]:
-                await self.start_match(interaction)
+                player_ids = [p[0] for p in pick[0]]
+                if READY_CHECK_ENABLED:
+                    unconfirmed = [p for p in player_ids if p not in confirmed]
+                    check_started = time.time()
+                    ready = await self.ready_check(interaction, unconfirmed)
+                    if ready is None:
+                        return
+                    ready_check_time += time.time() - check_started
+                    confirmed |= ready
+                    if len(ready) < len(unconfirmed):
+                        continue
+                popped = await self.start_match(interaction, player_ids, ready_check_time)
+                if popped is None:
+                    return
+                if popped:
+                    confirmed -= set(player_ids)
+                    ready_check_time = 0.0
         except sqlite3.Error as e:
             print(f"Error checking queue size: {e}")
     
     @discord.ui.button(label="Leave Queue", style=discord.ButtonStyle.red, custom_id="leave_queue")
     async def leave_queue(self, interaction: discord.Interaction, button: Button):
+        # A party queues and leaves together
+        party_id = self.bot.parties.party_of(interaction.user.id)
+        member_ids = self.bot.parties.members(party_id) if party_id else [interaction.user.id]
         try:
             with get_db_cursor() as c:
-                c.execute("DELETE FROM queue WHERE user_id=?", (interaction.user.id,))
+                c.executemany(
+                    "DELETE FROM queue WHERE user_id=? AND queue_type=?",
+                    [(p, self.queue_type) for p in member_ids]
+                )
         except sqlite3.Error as e:
             print(f"Database error in leave_queue: {e}")
             await interaction.response.send_message("Error leaving queue. Please try again.", ephemeral=True)
             return
         
-        await self.update_queue_embed()
-        await interaction.response.send_message(f"You left {self.queue_type} queue.", ephemeral=True)
+        for player_id in member_ids:
+            self.bot.queue_expiry.forget(player_id, self.queue_type)
+        self.bot.queue_boards.mark([self.queue_type])
+        self.bot.journal.record("queue_leave", user_id=interaction.user.id, queue_type=self.queue_type, players=member_ids)
+        left = "Your party left" if party_id else "You left"
+        await interaction.response.send_message(f"{left} {self.queue_type} queue.", ephemeral=True)
     
-    async def get_reaction_users(self, reaction):
-        users = []
-        async for user in reaction.users():
-            if user != self.bot.user:
-                users.append(user)
-        return users
+    def pick_match(self, c, only_ids=None):
+        """Return (players, team_a, team_b) for the earliest queued parties that fill both teams, or None.
+
+        With only_ids, only those queued players are considered.
+        """
+        c.execute(
+            "SELECT user_id, username, party_id FROM queue WHERE queue_type=? ORDER BY joined_at, rowid",
+            (self.queue_type,)
+        )
+        rows = c.fetchall()
+        if only_ids is not None:
+            rows = [row for row in rows if row[0] in only_ids]
+        units = group_queue_units(rows)
+        teams = pack_parties(units, QUEUE_TYPES[self.queue_type]["team_size"])
+        if not teams:
+            return None
+        team_a, team_b = teams
+        return team_a + team_b, [p[0] for p in team_a], [p[0] for p in team_b]
+    
+    async def ready_check(self, interaction: discord.Interaction, player_ids):
+        """Ask players about to be matched to confirm and drop anyone who doesn't.
+
+        Returns the set of players who confirmed, or None if another check
+        for this queue is running or the check failed.
+        """
+        if self.queue_type in self.bot.ready_checks:
+            return None
+        self.bot.ready_checks.add(self.queue_type)
+        
+        try:
+            view = ReadyCheckView(player_ids)
+            message = await interaction.channel.send(
+                content=" ".join(f"<@{p}>" for p in player_ids),
+                embed=view.render(),
+                view=view
+            )
+            try:
+                await asyncio.wait_for(view.all_ready.wait(), timeout=READY_CHECK_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            view.stop()
+            self.bot.journal.record(
+                "ready_check", queue_type=self.queue_type, ready=sorted(view.ready), not_ready=sorted(view.pending)
+            )
+            
+            if view.pending:
+                evict_queue_entries([(p, self.queue_type) for p in view.pending], "not ready")
+                await interaction.channel.send(
+                    "Not ready, removed from the queue: " + " ".join(f"<@{p}>" for p in view.pending)
+                )
+            try:
+                await message.edit(embed=view.render(), view=None)
+            except discord.HTTPException as e:
+                print(f"Error updating ready check: {e}")
+        except (sqlite3.Error, discord.HTTPException) as e:
+            print(f"Error during ready check: {e}")
+            return None
+        finally:
+            self.bot.ready_checks.discard(self.queue_type)
+        
+        self.bot.queue_boards.mark([self.queue_type])
+        return view.ready
     
     async def start_vote(self, channel, title, description, options, timeout=30):
         if not options:
@@ -224,36 +1422,35 @@ class MatchmakingView(View):
         embed = discord.Embed(title=title, description=description, color=0x3498db)
         
         emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+        options = options[:len(emojis)]
         
-        for i, option in enumerate(options[:len(emojis)]):
+        for i, option in enumerate(options):
             embed.add_field(name=f"{emojis[i]} {option}", value="\u200b", inline=False)
         
         msg = await channel.send(embed=embed)
         
-        for i in range(len(options[:len(emojis)])):
-            await msg.add_reaction(emojis[i])
-        
-        await asyncio.sleep(timeout)
-        
+        # Reactions are tallied as they arrive, so no refetch is needed at the end
+        vote = ReactionVote(emojis[:len(options)], self.bot.user.id)
+        self.bot.router.add_reaction_handler(msg.id, vote)
         try:
-            msg = await channel.fetch_message(msg.id)
-            reactions = msg.reactions
+            for emoji in emojis[:len(options)]:
+                await msg.add_reaction(emoji)
             
-            votes = []
-            for i, reaction in enumerate(reactions):
-                if i >= len(options):
-                    continue
-                users = await self.get_reaction_users(reaction)
-                votes.append((options[i], len(users)))
-            
-            return max(votes, key=lambda x: x[1])[0] if votes else random.choice(options)
+            await asyncio.sleep(timeout)
         except Exception as e:
             print(f"Voting error: {e}")
             return random.choice(options)
+        finally:
+            self.bot.router.remove(msg.id)
+        
+        counts = vote.counts()
+        result = options[counts.index(max(counts))]
+        self.bot.journal.record("vote", channel_id=channel.id, title=title, result=result, counts=counts)
+        return result
     
     async def update_player_role(self, guild, player_id, new_elo):
         try:
-            member = guild.get_member(player_id)
+            member = await self.bot.members.get(guild, player_id)
             if not member:
                 return
             
@@ -285,23 +1482,90 @@ class MatchmakingView(View):
         except Exception as e:
             print(f"Error in update_player_role: {e}")
     
-    async def start_match(self, interaction: discord.Interaction):
+    async def choose_teams(self, channel, queue_players):
+        """Vote on captains and pick style, then split players into two teams"""
+        player_names = [p[1] for p in queue_players]
+        
+        # Captain voting
+        captains = await self.start_vote(
+            channel,
+            "🛡️ Captain Voting",
+            "Vote for 2 captains:",
+            player_names
+        )
+        
+        if isinstance(captains, str):
+            # If only one captain was voted, pick another random one
+            remaining_players = [p for p in player_names if p != captains]
+            captains = [captains, random.choice(remaining_players)]
+        else:
+            # Fallback to random selection if voting failed
+            captains = random.sample(player_names, 2)
+        
+        captain_ids = [queue_players[player_names.index(name)][0] for name in captains]
+        
+        # Team pick style vote
+        pick_style = await self.start_vote(
+            channel,
+            "⚙️ Team Pick Style",
+            "Vote for team selection style:",
+            ["Team Pick (captains choose)", "Random Teams"]
+        )
+        
+        team_a = [captain_ids[0]]
+        team_b = [captain_ids[1]]
+        remaining_players = [p[0] for p in queue_players if p[0] not in captain_ids]
+        
+        if pick_style == "Team Pick (captains choose)":
+            team_a, team_b = await self.bot.drafts.run(channel, captain_ids, remaining_players)
+        else:
+            random.shuffle(remaining_players)
+            for i, p in enumerate(remaining_players):
+                if i % 2 == 0:
+                    team_a.append(p)
+                else:
+                    team_b.append(p)
+        
+        return team_a, team_b
+    
+    async def start_match(self, interaction: discord.Interaction, player_ids=None, ready_check_time=None):
+        """Pop a match; with player_ids, from exactly those (ready-checked) players.
+
+        ready_check_time is logged with the pop. Returns True once the players
+        are popped, False if they can no longer form a match and None on a
+        database error.
+        """
         try:
             with get_db_cursor() as c:
-                c.execute("SELECT * FROM queue WHERE queue_type=?", (self.queue_type,))
-                queue_players = c.fetchall()
-                
-                if len(queue_players) < QUEUE_TYPES[self.queue_type]["total_players"]:
+                pick = self.pick_match(c, set(player_ids) if player_ids else None)
+                if not pick or (player_ids and len(pick[0]) != len(player_ids)):
                     await interaction.followup.send("Not enough players in queue!", ephemeral=True)
-                    return
+                    return False
+                
+                queue_players, packed_a, packed_b = pick
                 
-                c.execute("DELETE FROM queue WHERE queue_type=?", (self.queue_type,))
+                # Take the players out of every queue they're in, in the same
+                # transaction as the pick, so nobody is booked into two matches
+                placeholders = ",".join("?" * len(queue_players))
+                picked_ids = [p[0] for p in queue_players]
+                c.execute(
+                    f"SELECT joined_at FROM queue WHERE user_id IN ({placeholders}) AND queue_type=?",
+                    picked_ids + [self.queue_type]
+                )
+                joined_at = [row[0] for row in c.fetchall() if row[0] is not None]
+                c.execute(f"SELECT DISTINCT queue_type FROM queue WHERE user_id IN ({placeholders})", picked_ids)
+                touched_queues = [row[0] for row in c.fetchall()]
+                c.execute(f"DELETE FROM queue WHERE user_id IN ({placeholders})", picked_ids)
         except sqlite3.Error as e:
             print(f"Database error in start_match: {e}")
             await interaction.followup.send("Error starting match. Please try again.", ephemeral=True)
-            return
+            return None
+        
+        popped_at = time.time()
+        for player_id, _ in queue_players:
+            self.bot.queue_expiry.forget(player_id)
         
-        await self.update_queue_embed()
+        self.bot.queue_boards.mark(touched_queues)
         
         guild = interaction.guild
         overwrites = {
@@ -309,115 +1573,45 @@ class MatchmakingView(View):
             guild.me: discord.PermissionOverwrite(read_messages=True)
         }
         
-        for player_id, _, _ in queue_players:
-            member = guild.get_member(player_id)
-            if member:
-                overwrites[member] = discord.PermissionOverwrite(read_messages=True)
+        members = await self.bot.members.get_many(guild, [p[0] for p in queue_players])
+        for member in members.values():
+            overwrites[member] = discord.PermissionOverwrite(read_messages=True)
         
         try:
             match_channel = await guild.create_text_channel(
                 name=f"match-{self.queue_type}-{random.randint(1000, 9999)}",
                 overwrites=overwrites
             )
+            waits = [popped_at - t for t in joined_at]
+            self.bot.journal.record(
+                "match_pop", channel_id=match_channel.id, at=popped_at,
+                queue_type=self.queue_type, players=[p[0] for p in queue_players],
+                queue_wait_avg=round(sum(waits) / len(waits), 1) if waits else None,
+                queue_wait_max=round(max(waits), 1) if waits else None,
+                ready_check=round(ready_check_time, 1) if ready_check_time is not None else None
+            )
             
             player_names = [p[1] for p in queue_players]
             player_ids = [p[0] for p in queue_players]
             
-            # Captain voting
-            captains = await self.start_vote(
-                match_channel,
-                "🛡️ Captain Voting",
-                "Vote for 2 captains:",
-                player_names
-            )
-            
-            if isinstance(captains, str):
-                # If only one captain was voted, pick another random one
-                remaining_players = [p for p in player_names if p != captains]
-                captains = [captains, random.choice(remaining_players)]
+            if self.bot.parties.any_party(player_ids):
+                # Parties stay together, so use the packed teams and skip the draft
+                team_a, team_b = packed_a, packed_b
+                await match_channel.send("Teams were formed around the parties in this match.")
             else:
-                # Fallback to random selection if voting failed
-                captains = random.sample(player_names, 2)
-            
-            captain_ids = [queue_players[player_names.index(name)][0] for name in captains]
-            
-            # Team pick style vote
-            pick_style = await self.start_vote(
-                match_channel,
-                "⚙️ Team Pick Style",
-                "Vote for team selection style:",
-                ["Team Pick (captains choose)", "Random Teams"]
-            )
-            
-            team_a = [captain_ids[0]]
-            team_b = [captain_ids[1]]
-            remaining_players = [p[0] for p in queue_players if p[0] not in captain_ids]
+                team_a, team_b = await self.choose_teams(match_channel, queue_players)
+            self.bot.journal.record("teams", channel_id=match_channel.id, team_a=team_a, team_b=team_b)
             
-            if pick_style == "Team Pick (captains choose)":
-                turn = 0
-                while remaining_players:
-                    current_captain = team_a[0] if turn == 0 else team_b[0]
-                    captain_member = guild.get_member(current_captain)
-                    
-                    if captain_member:
-                        embed = discord.Embed(
-                            title=f"Team {'A' if turn == 0 else 'B'} Captain's Turn",
-                            description=f"<@{current_captain}>, pick a player by reacting:",
-                            color=0x3498db
-                        )
-                        
-                        options = [f"<@{p}>" for p in remaining_players]
-                        for i, option in enumerate(options):
-                            embed.add_field(name=f"{i+1}. {option}", value="\u200b", inline=False)
-                        
-                        pick_msg = await match_channel.send(embed=embed)
-                        
-                        for i in range(len(options)):
-                            await pick_msg.add_reaction(f"{i+1}\N{variation selector-16}\N{combining enclosing keycap}")
-                        
-                        def check(reaction, user):
-                            return user.id == current_captain and str(reaction.emoji) in [f"{i+1}\N{variation selector-16}\N{combining enclosing keycap}" for i in range(len(options))]
-                        
-                        try:
-                            reaction, _ = await self.bot.wait_for('reaction_add', timeout=60.0, check=check)
-                            picked_index = int(str(reaction.emoji)[0]) - 1
-                            picked_player = remaining_players[picked_index]
-                            
-                            if turn == 0:
-                                team_a.append(picked_player)
-                            else:
-                                team_b.append(picked_player)
-                            
-                            remaining_players.remove(picked_player)
-                            turn = 1 - turn
-                            
-                            await match_channel.send(f"<@{current_captain}> picked <@{picked_player}>!")
-                        except asyncio.TimeoutError:
-                            picked_player = random.choice(remaining_players)
-                            if turn == 0:
-                                team_a.append(picked_player)
-                            else:
-                                team_b.append(picked_player)
-                            
-                            remaining_players.remove(picked_player)
-                            turn = 1 - turn
-                            
-                            await match_channel.send(f"Captain didn't pick in time! Randomly assigned <@{picked_player}>.")
+            map_pool = self.bot.map_pool
+            if map_pool.selection_mode(guild.id) == "instant":
+                selected_map = map_pool.choose(guild.id, player_ids)[0]
             else:
-                random.shuffle(remaining_players)
-                for i, p in enumerate(remaining_players):
-                    if i % 2 == 0:
-                        team_a.append(p)
-                    else:
-                        team_b.append(p)
-            
-            maps = ["Urban", "Air Force", "Sandstorm", "Rampage", "District", "Iraq", "Morocco"]
-            selected_map = await self.start_vote(
-                match_channel,
-                "🗺️ Map Voting",
-                "Vote for the map:",
-                maps
-            )
+                selected_map = await self.start_vote(
+                    match_channel,
+                    "🗺️ Map Voting",
+                    "Vote for the map:",
+                    map_pool.choose(guild.id, player_ids, MAP_VOTE_CANDIDATES)
+                )
             
             creator_vote = await self.start_vote(
                 match_channel,
@@ -433,7 +1627,7 @@ class MatchmakingView(View):
             team_b_channel = await guild.create_voice_channel(name=f"Team B - {selected_map}", overwrites=overwrites)
             
             for player_id in team_a:
-                member = guild.get_member(player_id)
+                member = members.get(player_id)
                 if member and member.voice:
                     try:
                         await member.move_to(team_a_channel)
@@ -441,7 +1635,7 @@ class MatchmakingView(View):
                         pass
             
             for player_id in team_b:
-                member = guild.get_member(player_id)
+                member = members.get(player_id)
                 if member and member.voice:
                     try:
                         await member.move_to(team_b_channel)
@@ -467,14 +1661,22 @@ class MatchmakingView(View):
             try:
                 with get_db_cursor() as c:
                     c.execute(
-                        "INSERT INTO matches (team_a_players, team_b_players, map_played) VALUES (?, ?, ?)",
-                        (','.join(map(str, team_a)), ','.join(map(str, team_b)), selected_map)
+                        """INSERT INTO matches (team_a_players, team_b_players, map_played,
+                                                match_channel_id, team_a_channel_id, team_b_channel_id)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (','.join(map(str, team_a)), ','.join(map(str, team_b)), selected_map,
+                         match_channel.id, team_a_channel.id, team_b_channel.id)
                     )
                     match_id = c.lastrowid
+                    MapPool.record_played(c, player_ids, selected_map)
             except sqlite3.Error as e:
                 print(f"Error saving match to database: {e}")
                 await match_channel.send("Error saving match data. Results may not be recorded properly.")
-                return
+                return True
+            self.bot.journal.record(
+                "match_created", match_id=match_id, channel_id=match_channel.id,
+                map=selected_map, room_creator=creator_id
+            )
             
             voting_view = MatchResultView(
                 bot=self.bot,
@@ -501,9 +1703,41 @@ class MatchmakingView(View):
                 await match_channel.send(f"❌ Error occurred: {str(e)}")
             except:
                 await interaction.followup.send(f"❌ Error occurred: {str(e)}", ephemeral=True)
+        return True
 
 
-class MatchResultView(View):
+class ReadyCheckView(ThrottledView):
+    def __init__(self, player_ids):
+        super().__init__(timeout=READY_CHECK_TIMEOUT)
+        self.pending = set(player_ids)
+        self.ready = set()
+        self.all_ready = asyncio.Event()
+    
+    def render(self):
+        embed = discord.Embed(
+            title="✅ Ready Check",
+            description=f"Match found! Click Ready within {READY_CHECK_TIMEOUT}s to keep your spot.",
+            color=discord.Color.green() if not self.pending else discord.Color.orange()
+        )
+        embed.add_field(name=f"Ready ({len(self.ready)})", value="\n".join(f"<@{p}>" for p in self.ready) or "-", inline=True)
+        embed.add_field(name=f"Waiting ({len(self.pending)})", value="\n".join(f"<@{p}>" for p in self.pending) or "-", inline=True)
+        return embed
+    
+    @discord.ui.button(label="Ready", style=discord.ButtonStyle.green)
+    async def confirm_ready(self, interaction: discord.Interaction, button: Button):
+        if interaction.user.id not in self.pending:
+            message = "You're already ready!" if interaction.user.id in self.ready else "You're not in this ready check."
+            await interaction.response.send_message(message, ephemeral=True)
+            return
+        
+        self.pending.discard(interaction.user.id)
+        self.ready.add(interaction.user.id)
+        if not self.pending:
+            self.all_ready.set()
+        await interaction.response.edit_message(embed=self.render())
+
+
+class MatchResultView(ThrottledView):
     def __init__(self, bot, match_id, team_a, team_b, match_channel, team_a_channel, team_b_channel, admin_channel=None, leaderboard_channel=None, admin_results=None):
         super().__init__(timeout=None)
         self.bot = bot
@@ -517,103 +1751,69 @@ class MatchResultView(View):
         self.leaderboard_channel = leaderboard_channel
         self.admin_results = admin_results
     
-    async def process_result(self, interaction: discord.Interaction, winning_team: str):
+    async def process_result(self, interaction: discord.Interaction, winning_team: str, admin_override=False):
         # Check if user was in the match
-        if interaction.user.id not in self.team_a + self.team_b:
+        if not admin_override and interaction.user.id not in self.team_a + self.team_b:
             await interaction.response.send_message("You weren't in this match!", ephemeral=True)
             return
         
-        conn = None
-        try:
-            conn = sqlite3.connect('elo_bot.db', timeout=10, check_same_thread=False)
-            c = conn.cursor()
-            
-            # Check if result already recorded
-            c.execute("SELECT winning_team FROM matches WHERE match_id=?", (self.match_id,))
-            result = c.fetchone()
-            if result and result[0] is not None:
-                await interaction.response.send_message("Result already recorded!", ephemeral=True)
+        settlements = self.bot.settlements
+        if await self.reply_if_settled(interaction):
+            return
+        
+        async with settlements.lock(self.match_id):
+            if await self.reply_if_settled(interaction):
                 return
             
-            # Update match result
-            c.execute(
-                "UPDATE matches SET winning_team=? WHERE match_id=?",
-                (winning_team, self.match_id)
-            )
-            
-            # Determine winners and losers
-            winners = self.team_a if winning_team == "A" else self.team_b
-            losers = self.team_b if winning_team == "A" else self.team_a
-            
-            # Update player ELO and stats - with existence check
-            for player_id in winners + losers:
-                # First ensure player exists
-                c.execute("SELECT 1 FROM players WHERE user_id=?", (player_id,))
-                if not c.fetchone():
-                    member = interaction.guild.get_member(player_id)
-                    username = str(member) if member else f"Unknown User {player_id}"
-                    c.execute(
-                        "INSERT INTO players (user_id, username, elo, wins, losses) VALUES (?, ?, ?, ?, ?)",
-                        (player_id, username, 25 if player_id in winners else -25, 
-                         1 if player_id in winners else 0, 0 if player_id in winners else 1)
-                    )
-                else:
-                    # Update existing player
-                    c.execute(
-                        "UPDATE players SET elo=elo+?, wins=wins+?, losses=losses+? WHERE user_id=?",
-                        (25 if player_id in winners else -25, 
-                         1 if player_id in winners else 0,
-                         0 if player_id in winners else 1,
-                         player_id)
+            names = await self.bot.members.display_names(interaction.guild, self.team_a + self.team_b)
+            try:
+                with get_db_cursor() as c:
+                    settlement = settle_match(
+                        c, self.match_id, winning_team, self.team_a, self.team_b, interaction.guild, names
                     )
-                
-                # Get new ELO for role update
-                c.execute("SELECT elo FROM players WHERE user_id=?", (player_id,))
-                elo_result = c.fetchone()
-                if elo_result:
-                    await self.update_player_role(interaction.guild, player_id, elo_result[0])
+                recorded = recorded_winner(self.match_id) if settlement is None else None
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                await interaction.response.send_message(
+                    "❌ Database error occurred while processing results.",
+                    ephemeral=True
+                )
+                return
             
-            conn.commit()
+            if settlement is None:
+                if recorded is None:
+                    await interaction.response.send_message("This match was voided or no longer exists.", ephemeral=True)
+                    return
+                settlements.remember(self.match_id, recorded)
+                await self.reply_if_settled(interaction)
+                return
+            
+            settlements.remember(self.match_id, winning_team)
+            self.bot.journal.record(
+                "admin_override" if admin_override else "result", match_id=self.match_id,
+                user_id=interaction.user.id, winning_team=winning_team, elo_change=settlement[0]
+            )
+            await self.finish_settlement(interaction, winning_team, settlement)
+    
+    async def reply_if_settled(self, interaction: discord.Interaction):
+        winning_team = self.bot.settlements.winner(self.match_id)
+        if winning_team is None:
+            return False
+        await interaction.response.send_message(
+            f"Result already recorded! Team {winning_team} won.", ephemeral=True
+        )
+        return True
+    
+    async def finish_settlement(self, interaction: discord.Interaction, winning_team, settlement):
+        delta, map_played, player_rows = settlement
+        try:
+            apply_settlement_side_effects(interaction.guild, player_rows)
             
             # Send results to admin channel
             if self.admin_channel:
-                c.execute("SELECT map_played FROM matches WHERE match_id=?", (self.match_id,))
-                map_played = c.fetchone()[0]
-                
-                embed = discord.Embed(
-                    title="🏆 Match Results",
-                    color=0x00ff00
+                embed = build_result_embed(
+                    self.match_id, winning_team, map_played, delta, self.team_a, self.team_b, player_rows
                 )
-                
-                embed.add_field(
-                    name=f"Team {winning_team} Won",
-                    value=f"**Map:** {map_played}",
-                    inline=False
-                )
-                
-                # Team A text with ELO changes
-                team_a_text = []
-                for p in self.team_a:
-                    c.execute("SELECT username, elo FROM players WHERE user_id=?", (p,))
-                    row = c.fetchone()
-                    if row:
-                        username, elo = row
-                        change = "+25" if p in winners else "-25"
-                        team_a_text.append(f"{username} - {elo} ({change})")
-                
-                # Team B text with ELO changes
-                team_b_text = []
-                for p in self.team_b:
-                    c.execute("SELECT username, elo FROM players WHERE user_id=?", (p,))
-                    row = c.fetchone()
-                    if row:
-                        username, elo = row
-                        change = "+25" if p in winners else "-25"
-                        team_b_text.append(f"{username} - {elo} ({change})")
-                
-                embed.add_field(name="Team A", value="\n".join(team_a_text), inline=True)
-                embed.add_field(name="Team B", value="\n".join(team_b_text), inline=True)
-                
                 admin_channel_obj = interaction.guild.get_channel(self.admin_channel)
                 if admin_channel_obj:
                     await admin_channel_obj.send(embed=embed)
@@ -621,65 +1821,21 @@ class MatchResultView(View):
                 # Update leaderboard
                 if self.leaderboard_channel:
                     await self.update_leaderboard(self.leaderboard_channel)
-        
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            await interaction.response.send_message(
-                "❌ Database error occurred while processing results.",
-                ephemeral=True
-            )
-        except Exception as e:
-            print(f"Error in process_result: {e}")
-            await interaction.response.send_message(
-                "❌ An error occurred while processing results.",
-                ephemeral=True
-            )
-        finally:
-            if conn:
-                conn.close()
-        
-        # Delete match channels
-        try:
-            await self.match_channel.delete()
-            await self.team_a_channel.delete()
-            await self.team_b_channel.delete()
-        except Exception as e:
-            print(f"Error deleting channels: {e}")
-        
-        await interaction.response.send_message(
-            f"Result recorded! Team {winning_team} wins. ELO has been updated.",
-            ephemeral=True
-        )
-    
-    async def update_player_role(self, guild, player_id, new_elo):
-        try:
-            member = guild.get_member(player_id)
-            if not member:
-                return
-            
-            # Remove all old level roles
-            for level_data in ELO_LEVELS.values():
-                if level_data["role_id"]:
-                    try:
-                        role = guild.get_role(level_data["role_id"])
-                        if role and role in member.roles:
-                            await member.remove_roles(role)
-                    except discord.Forbidden:
-                        print(f"Missing permissions to remove role for {member}")
-                    except discord.HTTPException as e:
-                        print(f"Error removing role: {e}")
-            
-            # Add new role based on ELO (sorted in descending order)
-            for level in sorted(ELO_LEVELS.keys(), reverse=True):
-                level_data = ELO_LEVELS[level]
-                if new_elo >= level_data["min_elo"]:
-                    if level_data["role_id"]:
-                        role = guild.get_role(level_data["role_id"])
-                        if role:
-                            await member.add_roles(role)
-                    break
         except Exception as e:
-            print(f"Error in update_player_role: {e}")
+            print(f"Error in process_result: {e}")
+        
+        # Delete match channels
+        try:
+            for channel in (self.match_channel, self.team_a_channel, self.team_b_channel):
+                if channel:
+                    await channel.delete()
+        except Exception as e:
+            print(f"Error deleting channels: {e}")
+        
+        await interaction.response.send_message(
+            f"Result recorded! Team {winning_team} wins. ELO has been updated.",
+            ephemeral=True
+        )
     
     async def update_leaderboard(self, channel_id):
         guild = self.bot.get_guild(ADMIN_CHANNEL) if ADMIN_CHANNEL else None
@@ -745,6 +1901,7 @@ class MatchResultView(View):
             print(f"Error marking match as disputed: {e}")
             await interaction.response.send_message("Error disputing match result.", ephemeral=True)
             return
+        self.bot.journal.record("dispute", match_id=self.match_id, user_id=interaction.user.id)
         
         if self.admin_results and self.admin_channel:
             guild = interaction.guild
@@ -782,6 +1939,16 @@ class MatchResultView(View):
                     view=admin_view
                 )
                 
+                # Remember the message so the admin view survives restarts
+                try:
+                    with get_db_cursor() as c:
+                        c.execute(
+                            "UPDATE matches SET dispute_message_id=? WHERE match_id=?",
+                            (message.id, self.match_id)
+                        )
+                except sqlite3.Error as e:
+                    print(f"Error saving dispute message: {e}")
+                
                 await interaction.response.send_message(
                     "The match result has been disputed and sent to admins for review.",
                     ephemeral=True
@@ -794,7 +1961,7 @@ class MatchResultView(View):
         )
 
 
-class AdminMatchResultView(View):
+class AdminMatchResultView(ThrottledView):
     def __init__(self, bot, match_id, team_a, team_b, match_channel, team_a_channel, team_b_channel, admin_channel=None, leaderboard_channel=None, admin_results=None):
         super().__init__(timeout=None)
         self.bot = bot
@@ -826,68 +1993,1115 @@ class AdminMatchResultView(View):
             leaderboard_channel=self.leaderboard_channel,
             admin_results=self.admin_results
         )
-        await match_view.process_result(interaction, winning_team)
+        await match_view.process_result(interaction, winning_team, admin_override=True)
     
-    @discord.ui.button(label="Confirm Team A Win", style=discord.ButtonStyle.green)
+    @discord.ui.button(label="Confirm Team A Win", style=discord.ButtonStyle.green, custom_id="admin_confirm_a")
     async def confirm_team_a(self, interaction: discord.Interaction, button: Button):
         await self._process_admin_result(interaction, "A")
     
-    @discord.ui.button(label="Confirm Team B Win", style=discord.ButtonStyle.red)
+    @discord.ui.button(label="Confirm Team B Win", style=discord.ButtonStyle.red, custom_id="admin_confirm_b")
     async def confirm_team_b(self, interaction: discord.Interaction, button: Button):
         await self._process_admin_result(interaction, "B")
 
 
-class EloBot(commands.Bot):
+class RoleSyncQueue:
+    """Background queue that applies level roles at a steady rate.
+
+    Updates are coalesced per member, so only the latest ELO is applied,
+    and each member costs at most one role edit.
+    """
+
+    def __init__(self, bot, interval=ROLE_SYNC_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self._pending: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, guild_id, user_id, elo):
+        self._pending.pop((guild_id, user_id), None)
+        self._pending[(guild_id, user_id)] = elo
+        self._wakeup.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                (guild_id, user_id), elo = self._pending.popitem(last=False)
+                if await self._apply(guild_id, user_id, elo):
+                    await asyncio.sleep(self.interval)
+
+    async def _apply(self, guild_id, user_id, elo):
+        guild = self.bot.get_guild(guild_id)
+        # The edit replaces the whole role list, so start from the member's current roles
+        member = await self.bot.members.fresh(guild, user_id) if guild else None
+        if not member:
+            return False
+        
+        level_role_ids = {data["role_id"] for data in ELO_LEVELS.values() if data["role_id"]}
+        level = get_level(elo)
+        target_role = guild.get_role(ELO_LEVELS[level]["role_id"]) if level else None
+        
+        roles = [r for r in member.roles if not r.is_default() and r.id not in level_role_ids]
+        if target_role:
+            roles.append(target_role)
+        if set(roles) == {r for r in member.roles if not r.is_default()}:
+            return False
+        
+        try:
+            updated = await member.edit(roles=roles, reason="ELO level sync")
+            self.bot.members.remember(updated or member, refresh=updated is None)
+        except discord.Forbidden:
+            print(f"Missing permissions to sync roles for {member}")
+        except discord.HTTPException as e:
+            print(f"Error syncing roles for {member}: {e}")
+        return True
+
+
+# Match event journal
+def write_journal(batch):
+    with get_db_cursor() as c:
+        c.executemany(
+            "INSERT INTO match_events (created_at, event, match_id, channel_id, user_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+            batch
+        )
+
+def load_match_events(match_id):
+    """Events for a match in order, including those logged before its row existed"""
+    with get_db_cursor() as c:
+        c.execute(
+            """SELECT created_at, event, user_id, data FROM match_events
+               WHERE match_id=?
+                  OR channel_id IN (SELECT channel_id FROM match_events
+                                    WHERE match_id=? AND event='match_created')
+               ORDER BY created_at, event_id""",
+            (match_id, match_id)
+        )
+        return c.fetchall()
+
+class EventJournal:
+    """Append-only log of queue and match events, written with group commit.
+
+    record() only appends to a buffer. A writer task waits a few
+    milliseconds after the first event so a burst lands in one batch, then
+    inserts the batch in a single transaction off the event loop.
+    """
+
+    def __init__(self, delay=JOURNAL_FLUSH_DELAY, max_batch=JOURNAL_MAX_BATCH):
+        self.delay = delay
+        self.max_batch = max_batch
+        self._buffer: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, event, match_id=None, channel_id=None, user_id=None, at=None, **data):
+        data = {key: value for key, value in data.items() if value is not None}
+        self._buffer.append(
+            (at or time.time(), event, match_id, channel_id, user_id, json.dumps(data) if data else None)
+        )
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        # One writer at a time, so a flush also waits for a batch already in flight
+        async with self._flushing:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch]
+                del self._buffer[:self.max_batch]
+                try:
+                    await asyncio.to_thread(write_journal, batch)
+                except sqlite3.Error as e:
+                    # Keep the events and retry with the next batch
+                    print(f"Error writing match events: {e}")
+                    self._buffer[:0] = batch
+                    return
+
+
+# Member lookup
+class MemberLookup:
+    """Resolves guild members without caching every member at startup.
+
+    Tries the gateway cache, then a bounded LRU of members fetched over
+    HTTP (including "not a member" answers), then fetches and remembers.
+    """
+
+    def __init__(self, capacity=MEMBER_FETCH_CACHE_SIZE, ttl=MEMBER_FETCH_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._members: "OrderedDict[Tuple[int, int], Tuple[Optional[discord.Member], float]]" = OrderedDict()
+
+    def remember(self, member, refresh=False):
+        """Cache a member object we already have; refresh=True drops it instead"""
+        if not isinstance(member, discord.Member):
+            return
+        key = (member.guild.id, member.id)
+        if refresh:
+            self._members.pop(key, None)
+            return
+        self._members[key] = (member, time.monotonic())
+        self._members.move_to_end(key)
+        while len(self._members) > self.capacity:
+            self._members.popitem(last=False)
+
+    def forget(self, guild_id, user_id):
+        self._members.pop((guild_id, user_id), None)
+
+    async def get(self, guild, user_id):
+        member = guild.get_member(user_id)
+        if member:
+            return member
+        
+        key = (guild.id, user_id)
+        cached = self._members.get(key)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            self._members.move_to_end(key)
+            return cached[0]
+        return await self._fetch(guild, user_id)
+
+    async def fresh(self, guild, user_id):
+        """Return a member with up-to-date roles, fetching unless the gateway tracks them.
+
+        Cached and remembered members don't receive member updates, so their
+        role lists can be stale; use this before editing roles.
+        """
+        member = guild.get_member(user_id)
+        if member:
+            return member
+        return await self._fetch(guild, user_id)
+
+    async def _fetch(self, guild, user_id):
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            member = None
+        except discord.HTTPException as e:
+            print(f"Error fetching member {user_id}: {e}")
+            return None
+        
+        key = (guild.id, user_id)
+        self._members[key] = (member, time.monotonic())
+        self._members.move_to_end(key)
+        while len(self._members) > self.capacity:
+            self._members.popitem(last=False)
+        return member
+
+    def cached(self, guild, user_id):
+        """Return a member from the gateway cache or the fetch cache, without fetching"""
+        member = guild.get_member(user_id)
+        if member:
+            return member
+        cached = self._members.get((guild.id, user_id))
+        return cached[0] if cached else None
+
+    async def display_names(self, guild, user_ids):
+        """Return {user_id: name}, fetching only players with no stored or cached name"""
+        names = {}
+        missing = []
+        if guild is None:
+            return names
+        for user_id in user_ids:
+            record = player_cache.get(user_id)
+            member = None if record else self.cached(guild, user_id)
+            if record:
+                names[user_id] = record.username
+            elif member:
+                names[user_id] = str(member)
+            else:
+                missing.append(user_id)
+        
+        for user_id, member in (await self.get_many(guild, missing)).items():
+            names[user_id] = str(member)
+        return names
+
+    async def get_many(self, guild, user_ids):
+        """Return {user_id: member} for the ids that are members of guild"""
+        members = await asyncio.gather(*(self.get(guild, user_id) for user_id in user_ids))
+        return {user_id: member for user_id, member in zip(user_ids, members) if member}
+
+
+# Queue maintenance
+class QueueExpiry:
+    """Min-heap of queue entries ordered by expiry time.
+
+    Entries that were left or re-joined stay in the heap and are skipped
+    when popped, so joins, leaves and sweeps are all O(log n) or better.
+    """
+
+    def __init__(self, ttl=QUEUE_ENTRY_TTL):
+        self.ttl = ttl
+        self._heap: List[Tuple[float, int, str, float]] = []
+        self._joined: Dict[Tuple[int, str], float] = {}
+
+    def track(self, user_id, queue_type, joined_at):
+        self._joined[(user_id, queue_type)] = joined_at
+        heapq.heappush(self._heap, (joined_at + self.ttl, user_id, queue_type, joined_at))
+
+    def forget(self, user_id, queue_type=None):
+        for qt in ([queue_type] if queue_type else QUEUE_TYPES):
+            self._joined.pop((user_id, qt), None)
+
+    def queued(self, user_id):
+        return [qt for qt in QUEUE_TYPES if (user_id, qt) in self._joined]
+
+    def pop_expired(self, now=None):
+        now = now or time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _, user_id, queue_type, joined_at = heapq.heappop(self._heap)
+            if self._joined.get((user_id, queue_type)) == joined_at:
+                del self._joined[(user_id, queue_type)]
+                expired.append((user_id, queue_type))
+        return expired
+
+def evict_queue_entries(entries, reason="expired"):
+    """Remove (user_id, queue_type) entries from the queue"""
+    if not entries:
+        return
+    with get_db_cursor() as c:
+        c.executemany("DELETE FROM queue WHERE user_id=? AND queue_type=?", entries)
+    for user_id, queue_type in entries:
+        bot.queue_expiry.forget(user_id, queue_type)
+        bot.journal.record("queue_evict", user_id=user_id, queue_type=queue_type, reason=reason)
+    bot.queue_boards.mark({queue_type for _, queue_type in entries})
+
+def render_queue_embed(queue_type):
+    """Build a queue board embed from a single read of the queue"""
+    with get_db_cursor() as c:
+        c.execute("SELECT username, party_id FROM queue WHERE queue_type=? ORDER BY joined_at", (queue_type,))
+        players = c.fetchall()
+    queue_size = len(players)
+    required = QUEUE_TYPES[queue_type]["total_players"]
+    
+    lines = [f"{'👥' if party_id else '•'} {username}" for username, party_id in players[:QUEUE_BOARD_NAMES]]
+    if queue_size > QUEUE_BOARD_NAMES:
+        lines.append(f"...and {queue_size - QUEUE_BOARD_NAMES} more")
+    
+    embed = discord.Embed(
+        title=f"⚔️ {queue_type} Matchmaking Queue",
+        description=f"**Status:** {queue_size}/{required} players ready",
+        color=discord.Color.green() if queue_size >= required else discord.Color.orange()
+    )
+    embed.add_field(name="Players in queue:", value="\n".join(lines) or "No players yet", inline=False)
+    embed.set_footer(text=f"Queue type: {queue_type} | Use buttons to join/leave")
+    return embed
+
+class QueueBoards:
+    """Registry of live queue messages per guild and queue type.
+
+    Changes mark queue types dirty. One pass on the next loop iteration
+    renders each dirty type once and edits every tracked message showing it,
+    skipping the edits when the render hasn't changed. Each guild keeps at
+    most QUEUE_BOARDS_PER_TYPE messages per queue type; older ones lose
+    their buttons.
+    """
+
+    def __init__(self, per_type=QUEUE_BOARDS_PER_TYPE):
+        self.per_type = per_type
+        # (guild_id, queue_type) -> {message_id: MatchmakingView}, oldest first
+        self._boards: Dict[Tuple[int, str], OrderedDict] = defaultdict(OrderedDict)
+        self._rendered: Dict[str, discord.Embed] = {}
+        self._dirty = set()
+        self._task = None
+
+    async def track(self, guild_id, view):
+        boards = self._boards[(guild_id, view.queue_type)]
+        boards[view.queue_message.id] = view
+        while len(boards) > self.per_type:
+            _, old = boards.popitem(last=False)
+            old.stop()
+            try:
+                await old.queue_message.edit(view=None)
+            except discord.HTTPException as e:
+                print(f"Error retiring queue message: {e}")
+        
+        embed = self._rendered.get(view.queue_type)
+        if embed is None:
+            try:
+                embed = self._rendered[view.queue_type] = render_queue_embed(view.queue_type)
+            except sqlite3.Error as e:
+                print(f"Error rendering queue board: {e}")
+                return
+        await self._edit(guild_id, view, embed)
+
+    def mark(self, queue_types):
+        self._dirty.update(queue_types)
+        if self._dirty and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Let the handler that marked us finish its other changes first
+        await asyncio.sleep(0)
+        # Marks made while edits are in flight are picked up by the next round
+        while self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            edits = []
+            for queue_type in dirty:
+                try:
+                    embed = render_queue_embed(queue_type)
+                except sqlite3.Error as e:
+                    print(f"Error rendering queue board: {e}")
+                    continue
+                previous = self._rendered.get(queue_type)
+                if previous is not None and previous.to_dict() == embed.to_dict():
+                    continue
+                self._rendered[queue_type] = embed
+                for (guild_id, qt), boards in self._boards.items():
+                    if qt == queue_type:
+                        edits.extend(self._edit(guild_id, view, embed) for view in list(boards.values()))
+            await asyncio.gather(*edits)
+
+    async def _edit(self, guild_id, view, embed):
+        try:
+            await view.queue_message.edit(embed=embed, view=view)
+        except discord.NotFound:
+            # Message was deleted; stop tracking it
+            self._boards[(guild_id, view.queue_type)].pop(view.queue_message.id, None)
+            view.stop()
+        except discord.HTTPException as e:
+            print(f"Error updating queue message: {e}")
+
+
+# Parties
+class PartyRegistry:
+    """Groups of players who queue and play on the same team.
+
+    Parties live in memory only; like queue entries they don't survive a restart.
+    The first member is the leader.
+    """
+
     def __init__(self):
-        intents = discord.Intents.default()
-        intents.members = True
-        intents.message_content = True
-        super().__init__(command_prefix="!", intents=intents)
+        self._members: Dict[int, List[int]] = {}
+        self._party_of: Dict[int, int] = {}
+        self._next_id = 1
+
+    def party_of(self, user_id):
+        return self._party_of.get(user_id)
+
+    def members(self, party_id):
+        return list(self._members.get(party_id, ()))
+
+    def any_party(self, user_ids):
+        return any(user_id in self._party_of for user_id in user_ids)
+
+    def add(self, leader_id, user_id):
+        """Add user_id to leader_id's party, creating it if needed; returns the party id"""
+        party_id = self._party_of.get(leader_id)
+        if party_id is None:
+            party_id = self._next_id
+            self._next_id += 1
+            self._members[party_id] = [leader_id]
+            self._party_of[leader_id] = party_id
+        self._members[party_id].append(user_id)
+        self._party_of[user_id] = party_id
+        return party_id
+
+    def remove(self, user_id):
+        """Take user_id out of their party and return everyone who was in it.
+
+        A party left with a single member is disbanded.
+        """
+        party_id = self._party_of.pop(user_id, None)
+        if party_id is None:
+            return []
+        members = self._members[party_id]
+        members.remove(user_id)
+        affected = [user_id] + members
+        if len(members) < 2:
+            for member_id in members:
+                del self._party_of[member_id]
+            del self._members[party_id]
+        return affected
+
+def group_queue_units(rows):
+    """Group (user_id, username, party_id) queue rows into parties and solo players, in join order"""
+    units = {}
+    for user_id, username, party_id in rows:
+        units.setdefault(party_id or ("solo", user_id), []).append((user_id, username))
+    return list(units.values())
+
+def pack_parties(units, team_size):
+    """Fit the earliest queued units into two full teams without splitting any unit.
+
+    Walks the queue in join order tracking every reachable (team A size,
+    team B size) pair, at most (team_size + 1) ** 2 of them, and stops at the
+    first unit that completes both teams. Returns (team_a, team_b) or None.
+    """
+    goal = (team_size, team_size)
+    # state -> (previous state, unit index, side)
+    reached = {(0, 0): None}
+    for index, unit in enumerate(units):
+        size = len(unit)
+        for a, b in list(reached):
+            for state, side in (((a + size, b), 0), ((a, b + size), 1)):
+                if max(state) <= team_size and state not in reached:
+                    reached[state] = ((a, b), index, side)
+        if goal in reached:
+            break
+    else:
+        return None
     
-    async def setup_hook(self):
-        # Initialize level roles
-        for guild in self.guilds:
-            for level, level_data in ELO_LEVELS.items():
-                role = guild.get_role(level_data["role_id"])
-                if not role:
-                    try:
-                        role = await guild.create_role(name=f"Level {level}")
-                        ELO_LEVELS[level]["role_id"] = role.id
-                        
-                        # Store role ID in database
-                        with get_db_cursor() as c:
-                            c.execute(
-                                "INSERT OR REPLACE INTO level_roles VALUES (?, ?)",
-                                (level, role.id)
-                            )
-                    except Exception as e:
-                        print(f"Error creating role Level {level}: {e}")
+    teams = ([], [])
+    state = goal
+    while reached[state]:
+        state, index, side = reached[state]
+        teams[side][:0] = units[index]
+    return teams
+
+class PartyInviteView(ThrottledView):
+    def __init__(self, bot, leader, invitee):
+        super().__init__(timeout=PARTY_INVITE_TIMEOUT)
+        self.bot = bot
+        self.leader = leader
+        self.invitee = invitee
+    
+    @discord.ui.button(label="Accept", style=discord.ButtonStyle.green)
+    async def accept(self, interaction: discord.Interaction, button: Button):
+        if interaction.user.id != self.invitee.id:
+            await interaction.response.send_message("This invite isn't for you.", ephemeral=True)
+            return
         
-        self.add_view(QueueSelectView(self))
+        parties = self.bot.parties
+        party_id = parties.party_of(self.leader.id)
+        members = parties.members(party_id) if party_id else [self.leader.id]
+        if parties.party_of(self.invitee.id):
+            await interaction.response.send_message("Leave your current party first.", ephemeral=True)
+            return
+        if members[0] != self.leader.id or len(members) >= MAX_PARTY_SIZE:
+            await interaction.response.send_message("This invite is no longer valid.", ephemeral=True)
+            self.stop()
+            return
+        
+        party_id = parties.add(self.leader.id, self.invitee.id)
+        # The party's size changed, so any queue spot it held no longer fits
+        for member_id in parties.members(party_id):
+            self.bot.evict_member(member_id, "party changed")
+        
+        self.stop()
+        await interaction.response.edit_message(
+            content=f"{self.invitee.mention} joined {self.leader.mention}'s party!",
+            view=None
+        )
     
-    async def on_ready(self):
-        print(f'Logged in as {self.user} (ID: {self.user.id})')
-        print('------')
+    @discord.ui.button(label="Decline", style=discord.ButtonStyle.red)
+    async def decline(self, interaction: discord.Interaction, button: Button):
+        if interaction.user.id != self.invitee.id:
+            await interaction.response.send_message("This invite isn't for you.", ephemeral=True)
+            return
+        
+        self.stop()
+        await interaction.response.edit_message(
+            content=f"{self.invitee.mention} declined the party invite.",
+            view=None
+        )
+
+
+# Map pool
+class MapPool:
+    """Per-guild weighted map pools and selection mode, cached in memory"""
+
+    def __init__(self):
+        self._pools: Dict[int, Dict[str, float]] = {}
+        self._modes: Dict[int, str] = {}
+
+    def pool(self, guild_id):
+        pool = self._pools.get(guild_id)
+        if pool is None:
+            with get_db_cursor() as c:
+                c.execute("SELECT map, weight FROM map_pool WHERE guild_id=?", (guild_id,))
+                pool = dict(c.fetchall())
+            self._pools[guild_id] = pool
+        return pool or dict.fromkeys(DEFAULT_MAPS, 1.0)
+
+    def set_weight(self, guild_id, map_name, weight):
+        pool = dict(self.pool(guild_id))
+        pool[map_name] = weight
+        self._save(guild_id, pool)
+
+    def remove(self, guild_id, map_name):
+        pool = dict(self.pool(guild_id))
+        if pool.pop(map_name, None) is None:
+            return False
+        self._save(guild_id, pool)
+        return True
+
+    def _save(self, guild_id, pool):
+        # The whole pool is stored so editing a default pool keeps the other maps
+        with get_db_cursor() as c:
+            c.execute("DELETE FROM map_pool WHERE guild_id=?", (guild_id,))
+            c.executemany(
+                "INSERT INTO map_pool (guild_id, map, weight) VALUES (?, ?, ?)",
+                [(guild_id, map_name, weight) for map_name, weight in pool.items()]
+            )
+        self._pools[guild_id] = pool
+
+    def selection_mode(self, guild_id):
+        mode = self._modes.get(guild_id)
+        if mode is None:
+            try:
+                with get_db_cursor() as c:
+                    c.execute("SELECT map_selection FROM guild_settings WHERE guild_id=?", (guild_id,))
+                    row = c.fetchone()
+            except sqlite3.Error as e:
+                print(f"Error loading map selection mode: {e}")
+                return "vote"
+            mode = self._modes[guild_id] = row[0] if row else "vote"
+        return mode
+
+    def set_selection_mode(self, guild_id, mode):
+        with get_db_cursor() as c:
+            c.execute(
+                """INSERT INTO guild_settings (guild_id, map_selection) VALUES (?, ?)
+                   ON CONFLICT (guild_id) DO UPDATE SET map_selection=excluded.map_selection""",
+                (guild_id, mode)
+            )
+        self._modes[guild_id] = mode
+
+    def choose(self, guild_id, player_ids, count=1):
+        """Weighted random pick of up to count maps, avoiding maps these players played recently"""
+        try:
+            weights = dict(self.pool(guild_id))
+            recent = self.recent_plays(player_ids)
+        except sqlite3.Error as e:
+            print(f"Error loading map pool: {e}")
+            weights, recent = dict.fromkeys(DEFAULT_MAPS, 1.0), {}
+        
+        for map_name, plays in recent.items():
+            if map_name in weights:
+                weights[map_name] *= RECENT_MAP_PENALTY ** plays
+        
+        # Weighted sampling without replacement: keep the largest random() ** (1 / weight)
+        keyed = sorted(
+            ((random.random() ** (1 / weight), map_name) for map_name, weight in weights.items() if weight > 0),
+            reverse=True
+        )
+        return [map_name for _, map_name in keyed[:count]] or [random.choice(DEFAULT_MAPS)]
+
+    @staticmethod
+    def recent_plays(player_ids):
+        """Return {map: number of these players who played it recently}"""
+        if not player_ids:
+            return {}
+        placeholders = ",".join("?" * len(player_ids))
+        with get_db_cursor() as c:
+            c.execute(
+                f"""SELECT map, COUNT(*) FROM player_recent_maps
+                    WHERE user_id IN ({placeholders}) AND played_at >= datetime('now', ?)
+                    GROUP BY map""",
+                (*player_ids, f"-{RECENT_MAP_HOURS} hours")
+            )
+            return dict(c.fetchall())
+
+    @staticmethod
+    def record_played(c, player_ids, map_name):
+        c.executemany(
+            "INSERT OR REPLACE INTO player_recent_maps (user_id, map, played_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            [(player_id, map_name) for player_id in player_ids]
+        )
+
+
+# Event routing
+class InteractionRouter:
+    """Delivers reactions and component interactions to their owner by message ID.
+
+    Every wait_for predicate is evaluated on every event; here each event
+    costs one dict lookup however many matches are running.
+    """
+
+    def __init__(self):
+        self.reaction_handlers: Dict[int, object] = {}
+        self.component_handlers: Dict[int, object] = {}
+
+    def add_reaction_handler(self, message_id, handler):
+        self.reaction_handlers[message_id] = handler
+
+    def add_component_handler(self, message_id, handler):
+        self.component_handlers[message_id] = handler
+
+    def remove(self, message_id):
+        self.reaction_handlers.pop(message_id, None)
+        self.component_handlers.pop(message_id, None)
+
+    def dispatch_reaction(self, payload: discord.RawReactionActionEvent):
+        handler = self.reaction_handlers.get(payload.message_id)
+        if handler:
+            handler(payload)
+
+    async def dispatch_component(self, interaction: discord.Interaction):
+        handler = self.component_handlers.get(interaction.message.id)
+        if not handler:
+            await interaction.response.send_message("This has already ended.", ephemeral=True)
+            return
+        await handler(interaction)
+
+
+class ReactionVote:
+    """Live reaction tally for one vote message"""
+    __slots__ = ("emoji_index", "bot_id", "voters")
+
+    def __init__(self, emojis, bot_id):
+        self.emoji_index = {emoji: i for i, emoji in enumerate(emojis)}
+        self.bot_id = bot_id
+        self.voters = [set() for _ in emojis]
+
+    def __call__(self, payload: discord.RawReactionActionEvent):
+        index = self.emoji_index.get(str(payload.emoji))
+        if index is None or payload.user_id == self.bot_id:
+            return
+        if payload.event_type == "REACTION_ADD":
+            self.voters[index].add(payload.user_id)
+        else:
+            self.voters[index].discard(payload.user_id)
+
+    def counts(self):
+        return [len(voters) for voters in self.voters]
+
+
+# Custom IDs of components whose interactions go through the router
+ROUTED_SELECTS = ("draft_pick",)
+
+
+class RoutedComponentsView(ThrottledView):
+    """The one persistent view that hands routed components to the router.
+
+    Messages using these components are sent with a stopped view, so
+    discord.py keeps no per-message view and dispatch lands here.
+    """
+
+    def __init__(self, router):
+        super().__init__(timeout=None)
+        self.router = router
+        for custom_id in ROUTED_SELECTS:
+            select = Select(custom_id=custom_id, options=[discord.SelectOption(label="-")])
+            select.callback = self.route
+            self.add_item(select)
+    
+    async def route(self, interaction: discord.Interaction):
+        await self.router.dispatch_component(interaction)
+
+
+# Captain draft
+def draft_order(picks, mode=DRAFT_ORDER):
+    """Return the team (0 = A, 1 = B) that makes each of the picks"""
+    if mode == "snake":
+        return [((i + 1) // 2) % 2 for i in range(picks)]
+    return [i % 2 for i in range(picks)]
+
+
+class DraftEngine:
+    """Captain pick state for one match, with no Discord dependencies"""
+
+    def __init__(self, captains, pool, ratings=None, mode=DRAFT_ORDER):
+        self.captains = list(captains)
+        self.teams = ([captains[0]], [captains[1]])
+        self.pool = list(pool)
+        self.ratings = ratings or {}
+        self.mode = mode
+        self.order = draft_order(len(self.pool), mode)
+        self.turn = 0
+        # (team, player_id, auto_picked) for every pick so far
+        self.history: List[Tuple[int, int, bool]] = []
+
+    @property
+    def complete(self):
+        return not self.pool
+
+    @property
+    def current_team(self):
+        return self.order[self.turn]
+
+    @property
+    def current_captain(self):
+        return self.captains[self.current_team]
+
+    def pick(self, captain_id, player_id):
+        """Pick a player for the captain whose turn it is; returns False if not allowed"""
+        if self.complete or captain_id != self.current_captain or player_id not in self.pool:
+            return False
+        self._assign(player_id, auto=False)
+        return True
+
+    def auto_pick(self):
+        """Pick the highest rated player left for the current captain"""
+        player_id = max(self.pool, key=lambda p: self.ratings.get(p, 0))
+        self._assign(player_id, auto=True)
+        return player_id
+
+    def _assign(self, player_id, auto):
+        team = self.current_team
+        self.teams[team].append(player_id)
+        self.pool.remove(player_id)
+        self.history.append((team, player_id, auto))
+        self.turn += 1
+
+
+class DraftPickView(View):
+    """Pick menu for a draft message; interactions come in through the router"""
+
+    def __init__(self, engine):
+        super().__init__(timeout=None)
+        
+        select = Select(
+            placeholder=f"Team {'AB'[engine.current_team]} captain: pick a player",
+            options=[
+                discord.SelectOption(
+                    label=player_display_name(None, p)[:100],
+                    description=f"ELO {engine.ratings.get(p, 0)}",
+                    value=str(p)
+                )
+                for p in engine.pool[:25]
+            ],
+            custom_id="draft_pick"
+        )
+        self.add_item(select)
+        self.stop()
+
+
+class DraftSession:
+    __slots__ = ("engine", "message", "future", "timer")
+
+    def __init__(self, engine, message, future):
+        self.engine = engine
+        self.message = message
+        self.future = future
+        self.timer = None
+
+
+class DraftManager:
+    """Runs every captain draft from one table keyed by pick message ID.
+
+    Each draft has a single message that is edited in place. Picks arrive
+    from the interaction router and timeouts from a loop timer, so
+    concurrent drafts add no event listeners.
+    """
+
+    def __init__(self, bot, pick_timeout=DRAFT_PICK_TIMEOUT):
+        self.bot = bot
+        self.pick_timeout = pick_timeout
+        self.sessions: Dict[int, DraftSession] = {}
+
+    async def run(self, channel, captain_ids, pool):
+        """Draft the pool between two captains and return (team_a, team_b)"""
+        ratings = {}
+        for p in pool:
+            record = player_cache.get(p)
+            ratings[p] = record.elo if record else 0
+        
+        engine = DraftEngine(captain_ids, pool, ratings)
+        if engine.complete:
+            return engine.teams
+        
+        message = await channel.send(embed=self.render(engine), view=DraftPickView(engine))
+        session = DraftSession(engine, message, asyncio.get_running_loop().create_future())
+        self.sessions[message.id] = session
+        self.bot.router.add_component_handler(message.id, self.handle_pick)
+        self._arm_timer(session)
+        
+        try:
+            return await session.future
+        finally:
+            if session.timer:
+                session.timer.cancel()
+            self.sessions.pop(message.id, None)
+            self.bot.router.remove(message.id)
+
+    def render(self, engine):
+        if engine.complete:
+            embed = discord.Embed(title="✅ Teams Drafted", color=0x2ecc71)
+        else:
+            embed = discord.Embed(
+                title=f"Team {'AB'[engine.current_team]} Captain's Turn",
+                description=f"<@{engine.current_captain}>, pick a player from the menu below.",
+                color=0x3498db
+            )
+        
+        for name, team in (("Team A", engine.teams[0]), ("Team B", engine.teams[1])):
+            embed.add_field(name=name, value="\n".join(f"<@{p}>" for p in team), inline=True)
+        if engine.pool:
+            embed.add_field(
+                name="Available",
+                value="\n".join(f"<@{p}> ({engine.ratings.get(p, 0)})" for p in engine.pool),
+                inline=False
+            )
+        if engine.history:
+            team, player_id, auto = engine.history[-1]
+            note = " (auto-picked by rating)" if auto else ""
+            embed.set_footer(text=f"Last pick: Team {'AB'[team]}{note}")
+        elif not engine.complete:
+            embed.set_footer(text=f"Highest rated player is auto-picked after {self.pick_timeout}s")
+        return embed
+
+    def _arm_timer(self, session):
+        if session.timer:
+            session.timer.cancel()
+        session.timer = asyncio.get_running_loop().call_later(
+            self.pick_timeout, lambda: asyncio.create_task(self._timed_out(session))
+        )
+
+    async def _timed_out(self, session):
+        if session.future.done() or session.engine.complete:
+            return
+        session.engine.auto_pick()
+        self.record_pick(session)
+        try:
+            await session.message.edit(**self._advance(session))
+        except discord.HTTPException as e:
+            print(f"Error updating draft message: {e}")
+
+    def _advance(self, session):
+        """Finish or re-arm the draft after a pick; returns the message edit"""
+        engine = session.engine
+        if engine.complete:
+            if session.timer:
+                session.timer.cancel()
+            if not session.future.done():
+                session.future.set_result(engine.teams)
+            return {"embed": self.render(engine), "view": None}
+        
+        self._arm_timer(session)
+        return {"embed": self.render(engine), "view": DraftPickView(engine)}
+
+    async def handle_pick(self, interaction: discord.Interaction):
+        player_id = int(interaction.data["values"][0])
+        session = self.sessions.get(interaction.message.id)
+        if not session:
+            await interaction.response.send_message("This draft has ended.", ephemeral=True)
+            return
+        
+        if interaction.user.id != session.engine.current_captain:
+            await interaction.response.send_message("It's not your turn to pick!", ephemeral=True)
+            return
         
-        # Initialize database
-        init_db()
+        if not session.engine.pick(interaction.user.id, player_id):
+            await interaction.response.send_message("That player can't be picked.", ephemeral=True)
+            return
+        
+        self.record_pick(session, interaction.user.id)
+        await interaction.response.edit_message(**self._advance(session))
+    
+    def record_pick(self, session, user_id=None):
+        team, player_id, auto = session.engine.history[-1]
+        self.bot.journal.record(
+            "draft_pick", channel_id=session.message.channel.id, user_id=user_id,
+            team="AB"[team], player=player_id, auto=auto
+        )
+
+
+class EloBot(commands.Bot):
+    def __init__(self):
+        intents = discord.Intents.default()
+        # Member events drive queue eviction; the member list itself is not cached
+        intents.members = True
+        intents.presences = EVICT_ON_OFFLINE
+        super().__init__(
+            command_prefix="!",
+            intents=intents,
+            tree_cls=ThrottledCommandTree,
+            # Only members in voice stay cached; others are looked up through MemberLookup.
+            # Presence updates are dropped for uncached members, so offline eviction needs the full list.
+            chunk_guilds_at_startup=EVICT_ON_OFFLINE,
+            member_cache_flags=discord.MemberCacheFlags(voice=True, joined=EVICT_ON_OFFLINE)
+        )
+        self.role_sync = RoleSyncQueue(self)
+        self.router = InteractionRouter()
+        self.drafts = DraftManager(self)
+        self.map_pool = MapPool()
+        self.queue_expiry = QueueExpiry()
+        self.queue_boards = QueueBoards()
+        self.settlements = SettlementLedger()
+        self.throttle = Throttle()
+        self.members = MemberLookup()
+        self.journal = EventJournal()
+        self.parties = PartyRegistry()
+        self.ready_checks = set()
+        self.provisioned_guilds = set()
+    
+    async def setup_hook(self):
+        # setup_hook runs once per process, unlike on_ready which fires on every reconnect
+        await asyncio.to_thread(init_db)
         
         # Load role IDs from database
         try:
             with get_db_cursor() as c:
-                c.execute("SELECT * FROM level_roles")
+                c.execute("SELECT level, role_id FROM level_roles")
                 for level, role_id in c.fetchall():
                     if level in ELO_LEVELS:
                         ELO_LEVELS[level]["role_id"] = role_id
         except sqlite3.Error as e:
             print(f"Error loading role IDs: {e}")
         
-        # Sync commands
+        self.add_view(QueueSelectView(self))
+        self.add_view(RoutedComponentsView(self.router))
+        self.role_sync.start()
+        self.journal.start()
+        asyncio.create_task(self.queue_maintenance())
+        asyncio.create_task(self.throttle_maintenance())
+        
+        # Reattach admin views to disputes that are still open
+        try:
+            with get_db_cursor() as c:
+                c.execute(
+                    f"""SELECT match_id, team_a_players, team_b_players, dispute_message_id FROM matches
+                        WHERE {OPEN_DISPUTES_WHERE} AND dispute_message_id IS NOT NULL"""
+                )
+                open_disputes = c.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error loading open disputes: {e}")
+            open_disputes = []
+        
+        for match_id, team_a_players, team_b_players, message_id in open_disputes:
+            self.add_view(
+                AdminMatchResultView(
+                    self, match_id, parse_roster(team_a_players), parse_roster(team_b_players),
+                    None, None, None, ADMIN_CHANNEL, LEADERBOARD_CHANNEL, ADMIN_RESULTS_CHANNEL
+                ),
+                message_id=message_id
+            )
+        
+        try:
+            player_cache.warm()
+        except sqlite3.Error as e:
+            print(f"Error warming player cache: {e}")
+        
+        await self.sync_commands()
+    
+    async def sync_commands(self):
+        """Sync the command tree only when it changed since the last sync"""
+        payload = json.dumps(
+            [command.to_dict(self.tree) for command in self.tree.get_commands()],
+            sort_keys=True
+        )
+        tree_hash = hashlib.sha256(payload.encode()).hexdigest()
+        meta_key = f"command_tree_hash:{self.application_id}"
+        
+        try:
+            if get_meta(meta_key) == tree_hash:
+                print("Command tree unchanged, skipping sync")
+                return
+        except sqlite3.Error as e:
+            print(f"Error reading command tree hash: {e}")
+        
         try:
             synced = await self.tree.sync()
             print(f"Synced {len(synced)} commands")
         except Exception as e:
             print(f"Error syncing commands: {e}")
+            return
+        
+        try:
+            set_meta(meta_key, tree_hash)
+        except sqlite3.Error as e:
+            print(f"Error saving command tree hash: {e}")
+    
+    async def provision_level_roles(self, guild):
+        """Make sure every level has a role, creating only the missing ones"""
+        if guild.id in self.provisioned_guilds:
+            return
+        self.provisioned_guilds.add(guild.id)
+        
+        roles_by_id = {role.id: role for role in guild.roles}
+        roles_by_name = {role.name: role for role in guild.roles}
+        new_role_ids = []
+        
+        for level, level_data in ELO_LEVELS.items():
+            if level_data["role_id"] in roles_by_id:
+                continue
+            
+            role = roles_by_name.get(f"Level {level}")
+            if not role:
+                try:
+                    role = await guild.create_role(name=f"Level {level}")
+                except Exception as e:
+                    print(f"Error creating role Level {level}: {e}")
+                    continue
+            
+            ELO_LEVELS[level]["role_id"] = role.id
+            new_role_ids.append((level, role.id))
+        
+        # Store role IDs in database
+        if new_role_ids:
+            try:
+                with get_db_cursor() as c:
+                    c.executemany("INSERT OR REPLACE INTO level_roles VALUES (?, ?)", new_role_ids)
+            except sqlite3.Error as e:
+                print(f"Error saving role IDs: {e}")
+    
+    async def on_ready(self):
+        print(f'Logged in as {self.user} (ID: {self.user.id})')
+        print('------')
+        
+        for guild in self.guilds:
+            await self.provision_level_roles(guild)
+    
+    async def on_guild_join(self, guild):
+        await self.provision_level_roles(guild)
+    
+    async def close(self):
+        await self.journal.flush()
+        await super().close()
+    
+    async def queue_maintenance(self):
+        while True:
+            await asyncio.sleep(QUEUE_SWEEP_INTERVAL)
+            expired = self.queue_expiry.pop_expired()
+            if expired:
+                try:
+                    evict_queue_entries(expired)
+                    print(f"Removed {len(expired)} stale queue entries")
+                except sqlite3.Error as e:
+                    print(f"Error removing stale queue entries: {e}")
+    
+    async def throttle_maintenance(self):
+        while True:
+            await asyncio.sleep(THROTTLE_SWEEP_INTERVAL)
+            self.throttle.sweep()
+    
+    def evict_member(self, user_id, reason):
+        queue_types = self.queue_expiry.queued(user_id)
+        if not queue_types:
+            return
+        try:
+            evict_queue_entries([(user_id, qt) for qt in queue_types], reason)
+            print(f"Removed {user_id} from {', '.join(queue_types)} queue ({reason})")
+        except sqlite3.Error as e:
+            print(f"Error removing {user_id} from queue: {e}")
+    
+    async def on_raw_member_remove(self, payload):
+        self.members.forget(payload.guild_id, payload.user.id)
+        for user_id in self.parties.remove(payload.user.id) or [payload.user.id]:
+            self.evict_member(user_id, "left the server")
+    
+    async def on_presence_update(self, before, after):
+        if EVICT_ON_OFFLINE and after.status == discord.Status.offline:
+            self.evict_member(after.id, "went offline")
+    
+    async def on_voice_state_update(self, member, before, after):
+        if EVICT_ON_VOICE_LEAVE and before.channel and not after.channel:
+            self.evict_member(member.id, "left voice")
+    
+    async def on_raw_reaction_add(self, payload):
+        self.router.dispatch_reaction(payload)
+    
+    async def on_raw_reaction_remove(self, payload):
+        self.router.dispatch_reaction(payload)
 
 bot = EloBot()
 
@@ -898,18 +3112,18 @@ async def register(interaction: discord.Interaction):
     UNREGISTERED_ROLE_ID = 1396072475053265008  # Replace with unregistered role ID if exists
 
     try:
-        with get_db_cursor() as c:
-            # Check if player is already registered
-            c.execute("SELECT * FROM players WHERE user_id=?", (interaction.user.id,))
-            if c.fetchone():
-                await interaction.response.send_message("⚠️ You're already registered!", ephemeral=True)
-                return
+        # Check if player is already registered
+        if player_cache.get(interaction.user.id):
+            await interaction.response.send_message("⚠️ You're already registered!", ephemeral=True)
+            return
 
-            # Add player to database with 0 ELO
+        # Add player to database with 0 ELO
+        with get_db_cursor() as c:
             c.execute(
                 "INSERT INTO players (user_id, username, elo, wins, losses) VALUES (?, ?, 0, 0, 0)",
                 (interaction.user.id, str(interaction.user))
             )
+        player_cache.put(interaction.user.id, str(interaction.user), 0, 0, 0)
     except sqlite3.Error as e:
         print(f"Database error during registration: {e}")
         await interaction.response.send_message(
@@ -944,10 +3158,17 @@ async def register(interaction: discord.Interaction):
     print(f"New player registered: {interaction.user} (ID: {interaction.user.id})")
 
 @bot.tree.command(name="leaderboard", description="Show top 10 players by ELO")
-async def leaderboard(interaction: discord.Interaction):
+@app_commands.describe(season="Past season number to show instead of the current one")
+async def leaderboard(interaction: discord.Interaction, season: Optional[int] = None):
     try:
         with get_db_cursor() as c:
-            c.execute("SELECT username, elo, wins, losses FROM players ORDER BY elo DESC LIMIT 10")
+            if season is None:
+                c.execute("SELECT username, elo, wins, losses FROM players ORDER BY elo DESC LIMIT 10")
+            else:
+                c.execute(
+                    "SELECT username, elo, wins, losses FROM season_ratings WHERE season_id=? ORDER BY elo DESC LIMIT 10",
+                    (season,)
+                )
             top_players = c.fetchall()
     except sqlite3.Error as e:
         print(f"Error fetching leaderboard: {e}")
@@ -955,11 +3176,12 @@ async def leaderboard(interaction: discord.Interaction):
         return
     
     if not top_players:
-        await interaction.response.send_message("No players registered yet!", ephemeral=True)
+        message = "No players registered yet!" if season is None else f"No archived ratings for season {season}!"
+        await interaction.response.send_message(message, ephemeral=True)
         return
     
     embed = discord.Embed(
-        title="🏆 Leaderboard - Top 10 Players",
+        title="🏆 Leaderboard - Top 10 Players" if season is None else f"🏆 Season {season} Leaderboard - Top 10 Players",
         color=0xffd700
     )
     
@@ -974,31 +3196,39 @@ async def leaderboard(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="profile", description="Show your ELO profile")
-async def profile(interaction: discord.Interaction):
+@app_commands.describe(season="Past season number to show instead of the current one")
+async def profile(interaction: discord.Interaction, season: Optional[int] = None):
     try:
-        with get_db_cursor() as c:
-            c.execute("SELECT elo, wins, losses FROM players WHERE user_id=?", (interaction.user.id,))
-            result = c.fetchone()
+        if season is None:
+            record = player_cache.get(interaction.user.id)
+            result = (record.elo, record.wins, record.losses) if record else None
+        else:
+            with get_db_cursor() as c:
+                c.execute(
+                    "SELECT elo, wins, losses FROM season_ratings WHERE season_id=? AND user_id=?",
+                    (season, interaction.user.id)
+                )
+                result = c.fetchone()
     except sqlite3.Error as e:
         print(f"Error fetching profile: {e}")
         await interaction.response.send_message("Error loading profile. Please try again.", ephemeral=True)
         return
     
     if not result:
-        await interaction.response.send_message("You're not registered! Use `/register` first.", ephemeral=True)
+        if season is None:
+            await interaction.response.send_message("You're not registered! Use `/register` first.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"No archived profile for season {season}.", ephemeral=True)
         return
     
     elo, wins, losses = result
     win_rate = (wins / (wins + losses)) * 100 if (wins + losses) > 0 else 0
     
     # Get current level
-    current_level = 0
-    for level, data in ELO_LEVELS.items():
-        if elo >= data["min_elo"]:
-            current_level = level
+    current_level = get_level(elo)
     
     embed = discord.Embed(
-        title=f"{interaction.user}'s Profile",
+        title=f"{interaction.user}'s Profile" if season is None else f"{interaction.user}'s Season {season} Profile",
         color=0x3498db
     )
     
@@ -1010,6 +3240,45 @@ async def profile(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="stats", description="Show map, streak and teammate stats")
+async def stats(interaction: discord.Interaction, user: Optional[discord.Member] = None):
+    user = user or interaction.user
+    try:
+        streak, maps, teammates = load_player_stats(user.id)
+    except sqlite3.Error as e:
+        print(f"Error fetching stats: {e}")
+        await interaction.response.send_message("Error loading stats. Please try again.", ephemeral=True)
+        return
+    
+    if not streak and not maps:
+        await interaction.response.send_message(f"No match stats for {user.mention} yet.", ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title=f"{user}'s Stats",
+        color=0x3498db
+    )
+    
+    if streak:
+        current, best_win, worst_loss = streak
+        current_text = f"{current} wins" if current > 0 else f"{-current} losses" if current < 0 else "-"
+        embed.add_field(name="Current Streak", value=current_text, inline=True)
+        embed.add_field(name="Best Win Streak", value=str(best_win), inline=True)
+        embed.add_field(name="Worst Loss Streak", value=str(worst_loss), inline=True)
+    
+    map_lines = []
+    for map_played, wins, losses in maps:
+        win_rate = (wins / (wins + losses)) * 100 if (wins + losses) > 0 else 0
+        map_lines.append(f"{map_played}: {wins}/{losses} ({win_rate:.1f}%)")
+    embed.add_field(name="Maps", value="\n".join(map_lines) or "-", inline=False)
+    
+    teammate_lines = []
+    for teammate_id, games, wins in teammates:
+        teammate_lines.append(f"<@{teammate_id}>: {games} games, {wins / games * 100:.1f}% wins")
+    embed.add_field(name="Top Teammates", value="\n".join(teammate_lines) or "-", inline=False)
+    
+    await interaction.response.send_message(embed=embed)
+
 @bot.tree.command(name="queue", description="Show the matchmaking queue")
 async def show_queue(interaction: discord.Interaction):
     view = QueueSelectView(bot)
@@ -1034,6 +3303,8 @@ async def force_start(interaction: discord.Interaction, queue_type: str):
 async def reset_elo(interaction: discord.Interaction, user: discord.Member):
     try:
         with get_db_cursor() as c:
+            c.execute("SELECT elo, wins, losses FROM players WHERE user_id=?", (user.id,))
+            old = c.fetchone()
             c.execute(
                 "UPDATE players SET elo=0, wins=0, losses=0 WHERE user_id=?",
                 (user.id,)
@@ -1042,27 +3313,15 @@ async def reset_elo(interaction: discord.Interaction, user: discord.Member):
         print(f"Error resetting ELO: {e}")
         await interaction.response.send_message("Error resetting ELO. Please try again.", ephemeral=True)
         return
+    player_cache.invalidate([user.id])
+    if old:
+        bot.journal.record(
+            "rating_override", user_id=interaction.user.id, command="reset_elo",
+            player=user.id, old_elo=old[0], old_wins=old[1], old_losses=old[2], elo=0
+        )
     
     # Reset role to Level 1
-    if ELO_LEVELS[1]["role_id"]:
-        level_1_role = interaction.guild.get_role(ELO_LEVELS[1]["role_id"])
-        if level_1_role:
-            # Remove all other level roles
-            for level_data in ELO_LEVELS.values():
-                if level_data["role_id"] and level_data["role_id"] != ELO_LEVELS[1]["role_id"]:
-                    role = interaction.guild.get_role(level_data["role_id"])
-                    if role and role in user.roles:
-                        try:
-                            await user.remove_roles(role)
-                        except:
-                            pass
-            
-            # Add Level 1 role
-            if level_1_role not in user.roles:
-                try:
-                    await user.add_roles(level_1_role)
-                except:
-                    pass
+    bot.role_sync.enqueue(interaction.guild.id, user.id, 0)
     
     await interaction.response.send_message(
         f"Reset ELO for {user.mention} to 0 and set to Level 1.",
@@ -1074,6 +3333,8 @@ async def reset_elo(interaction: discord.Interaction, user: discord.Member):
 async def set_elo(interaction: discord.Interaction, user: discord.Member, elo: int):
     try:
         with get_db_cursor() as c:
+            c.execute("SELECT elo FROM players WHERE user_id=?", (user.id,))
+            old = c.fetchone()
             c.execute(
                 "UPDATE players SET elo=? WHERE user_id=?",
                 (elo, user.id)
@@ -1082,44 +3343,465 @@ async def set_elo(interaction: discord.Interaction, user: discord.Member, elo: i
         print(f"Error setting ELO: {e}")
         await interaction.response.send_message("Error setting ELO. Please try again.", ephemeral=True)
         return
+    player_cache.invalidate([user.id])
+    if old:
+        bot.journal.record(
+            "rating_override", user_id=interaction.user.id, command="set_elo", player=user.id, old_elo=old[0], elo=elo
+        )
     
     # Update player role based on new ELO
-    for level, level_data in sorted(ELO_LEVELS.items(), key=lambda x: x[0], reverse=True):
-        if elo >= level_data["min_elo"]:
-            if level_data["role_id"]:
-                role = interaction.guild.get_role(level_data["role_id"])
-                if role:
-                    # Remove all other level roles
-                    for other_level_data in ELO_LEVELS.values():
-                        if other_level_data["role_id"] and other_level_data["role_id"] != level_data["role_id"]:
-                            other_role = interaction.guild.get_role(other_level_data["role_id"])
-                            if other_role and other_role in user.roles:
-                                try:
-                                    await user.remove_roles(other_role)
-                                except:
-                                    pass
-                    
-                    # Add new role
-                    if role not in user.roles:
-                        try:
-                            await user.add_roles(role)
-                        except:
-                            pass
-                    break
+    bot.role_sync.enqueue(interaction.guild.id, user.id, elo)
     
     await interaction.response.send_message(
         f"Set {user.mention}'s ELO to {elo} and updated their level role.",
         ephemeral=True
     )
 
+@bot.tree.command(name="end_season", description="Archive ratings and start a new season (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(name="Name for the new season")
+async def end_season(interaction: discord.Interaction, name: Optional[str] = None):
+    await interaction.response.defer(ephemeral=True)
+    
+    try:
+        ended_name, new_season_id, changes = await asyncio.to_thread(rollover_season, name)
+    except sqlite3.Error as e:
+        print(f"Error ending season: {e}")
+        await interaction.followup.send("Error ending season. Please try again.", ephemeral=True)
+        return
+    
+    try:
+        player_cache.warm()
+    except sqlite3.Error as e:
+        print(f"Error warming player cache: {e}")
+    
+    for user_id, elo in changes:
+        bot.role_sync.enqueue(interaction.guild.id, user_id, elo)
+    
+    await interaction.followup.send(
+        f"{ended_name} archived. Season {new_season_id} has started; "
+        f"{len(changes)} level role updates queued.",
+        ephemeral=True
+    )
+
+@bot.tree.command(name="bulk_adjust", description="Adjust several players' ELO at once (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(adjustments="Entries like \"@user +25, @user -10, @user =300\"")
+async def bulk_adjust(interaction: discord.Interaction, adjustments: str):
+    parsed = parse_adjustments(adjustments)
+    if not parsed:
+        await interaction.response.send_message(
+            "No adjustments found. Use entries like `@user +25, @user -10, @user =300`.",
+            ephemeral=True
+        )
+        return
+    
+    try:
+        changes, missing = await asyncio.to_thread(apply_rating_adjustments, parsed)
+    except sqlite3.Error as e:
+        print(f"Error applying bulk adjustments: {e}")
+        await interaction.response.send_message("Error applying adjustments. Nothing was changed.", ephemeral=True)
+        return
+    
+    queued = queue_level_changes(interaction.guild, changes)
+    if changes:
+        bot.journal.record(
+            "rating_override", user_id=interaction.user.id, command="bulk_adjust", changes=[list(c) for c in changes]
+        )
+    
+    lines = [f"<@{user_id}>: {old_elo} → {new_elo}" for user_id, old_elo, new_elo in changes]
+    if missing:
+        lines.append("Not registered: " + ", ".join(f"<@{user_id}>" for user_id in missing))
+    lines.append(f"{queued} level role updates queued.")
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+@bot.tree.command(name="revert_match", description="Undo a match's ELO changes (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def revert_match_command(interaction: discord.Interaction, match_id: int):
+    try:
+        changes = await asyncio.to_thread(revert_match, match_id)
+    except ValueError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+        return
+    except sqlite3.Error as e:
+        print(f"Error reverting match: {e}")
+        await interaction.response.send_message("Error reverting match. Nothing was changed.", ephemeral=True)
+        return
+    
+    queued = queue_level_changes(interaction.guild, changes)
+    bot.journal.record("match_reverted", match_id=match_id, user_id=interaction.user.id)
+    
+    lines = [f"Match {match_id} reverted."]
+    lines += [f"<@{user_id}>: {old_elo} → {new_elo}" for user_id, old_elo, new_elo in changes]
+    lines.append(f"{queued} level role updates queued.")
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+@bot.tree.command(name="recompute_ratings", description="Rebuild ratings by replaying every match (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(apply="Write the replayed ratings back instead of only showing the differences")
+async def recompute_ratings_command(interaction: discord.Interaction, apply: bool = False):
+    await interaction.response.defer(ephemeral=True)
+    
+    try:
+        diffs = await asyncio.to_thread(recompute_ratings, apply)
+    except sqlite3.Error as e:
+        print(f"Error recomputing ratings: {e}")
+        await interaction.followup.send("Error recomputing ratings. Nothing was changed.", ephemeral=True)
+        return
+    
+    queued = 0
+    if apply:
+        queued = queue_level_changes(interaction.guild, [(user_id, old[0], new[0]) for user_id, old, new in diffs])
+    
+    lines = [f"{len(diffs)} players {'updated' if apply else 'would change'}."]
+    for user_id, (old_elo, old_wins, old_losses), (new_elo, new_wins, new_losses) in diffs[:20]:
+        lines.append(f"<@{user_id}>: {old_elo} ({old_wins}/{old_losses}) → {new_elo} ({new_wins}/{new_losses})")
+    if len(diffs) > 20:
+        lines.append(f"...and {len(diffs) - 20} more")
+    if apply:
+        lines.append(f"{queued} level role updates queued.")
+    await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+@bot.tree.command(name="disputes", description="List open match disputes (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def disputes(interaction: discord.Interaction, page: int = 1):
+    try:
+        total, page, rows = load_open_disputes(page)
+    except sqlite3.Error as e:
+        print(f"Error loading disputes: {e}")
+        await interaction.response.send_message("Error loading disputes. Please try again.", ephemeral=True)
+        return
+    
+    if not total:
+        await interaction.response.send_message("No open disputes!", ephemeral=True)
+        return
+    
+    pages = (total + DISPUTES_PER_PAGE - 1) // DISPUTES_PER_PAGE
+    embed = discord.Embed(
+        title=f"⚠️ Open Disputes ({total})",
+        description="Resolve with `/resolve_disputes 12:A 15:B 18:void`",
+        color=0xff0000
+    )
+    for match_id, timestamp, map_played, team_a_players, team_b_players in rows:
+        team_a = " ".join(f"<@{p}>" for p in parse_roster(team_a_players))
+        team_b = " ".join(f"<@{p}>" for p in parse_roster(team_b_players))
+        embed.add_field(
+            name=f"Match {match_id} - {map_played} ({timestamp})",
+            value=f"**A:** {team_a}\n**B:** {team_b}"[:1024],
+            inline=False
+        )
+    embed.set_footer(text=f"Page {page}/{pages}")
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="resolve_disputes", description="Settle many disputed matches at once (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(resolutions="Entries like \"12:A 15:B 18:void\"")
+async def resolve_disputes_command(interaction: discord.Interaction, resolutions: str):
+    parsed = parse_resolutions(resolutions)
+    if not parsed:
+        await interaction.response.send_message(
+            "No resolutions found. Use entries like `12:A 15:B 18:void`.",
+            ephemeral=True
+        )
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    try:
+        # Names are resolved here, on the event loop, so the worker thread makes no lookups
+        player_ids = await asyncio.to_thread(load_dispute_rosters, [match_id for match_id, _ in parsed])
+        names = await bot.members.display_names(interaction.guild, list(dict.fromkeys(player_ids)))
+        results = await asyncio.to_thread(resolve_disputes, parsed, None, names)
+    except sqlite3.Error as e:
+        print(f"Error resolving disputes: {e}")
+        await interaction.followup.send("Error resolving disputes. Nothing was changed.", ephemeral=True)
+        return
+    
+    embeds = []
+    lines = []
+    closed = []
+    for match_id, outcome, team_a, team_b, settlement, channel_ids, dispute_message_id in results:
+        if settlement or outcome == "void":
+            bot.journal.record("dispute_resolved", match_id=match_id, user_id=interaction.user.id, outcome=outcome)
+            closed.append((channel_ids, dispute_message_id))
+        if settlement:
+            delta, map_played, player_rows = settlement
+            bot.settlements.remember(match_id, outcome)
+            apply_settlement_side_effects(interaction.guild, player_rows)
+            embeds.append(build_result_embed(match_id, outcome, map_played, delta, team_a, team_b, player_rows))
+            lines.append(f"Match {match_id}: Team {outcome} won")
+        elif outcome == "void":
+            lines.append(f"Match {match_id}: voided")
+        else:
+            lines.append(f"Match {match_id}: skipped (not an open dispute)")
+    
+    await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+    
+    admin_channel = interaction.guild.get_channel(ADMIN_CHANNEL)
+    if admin_channel:
+        for i in range(0, len(embeds), 10):
+            try:
+                await admin_channel.send(embeds=embeds[i:i + 10])
+            except discord.HTTPException as e:
+                print(f"Error posting dispute results: {e}")
+    
+    # Close the resolved matches: their channels and the admin buttons on the dispute
+    for channel_ids, dispute_message_id in closed:
+        for channel_id in channel_ids:
+            channel = interaction.guild.get_channel(channel_id)
+            if channel:
+                try:
+                    await channel.delete()
+                except discord.HTTPException as e:
+                    print(f"Error deleting channels: {e}")
+        if admin_channel and dispute_message_id:
+            try:
+                await admin_channel.get_partial_message(dispute_message_id).edit(view=None)
+            except discord.HTTPException as e:
+                print(f"Error closing dispute message: {e}")
+
+@bot.tree.command(name="rebuild_stats", description="Rebuild map, streak and teammate stats from history (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def rebuild_stats_command(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    
+    try:
+        players = await asyncio.to_thread(rebuild_stats)
+    except sqlite3.Error as e:
+        print(f"Error rebuilding stats: {e}")
+        await interaction.followup.send("Error rebuilding stats. Nothing was changed.", ephemeral=True)
+        return
+    
+    await interaction.followup.send(f"Rebuilt stats for {players} players.", ephemeral=True)
+
+@bot.tree.command(name="export_data", description="Download players or matches as CSV/JSONL (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def export_data(interaction: discord.Interaction, table: Literal["players", "matches"], format: Literal["csv", "jsonl"] = "csv"):
+    await interaction.response.defer(ephemeral=True)
+    
+    fd, path = tempfile.mkstemp(suffix=f".{format}")
+    os.close(fd)
+    try:
+        # Export from an online backup so live writes are never blocked
+        count = await asyncio.to_thread(dbtool.export_snapshot, DB_PATH, table, path, format)
+        await interaction.followup.send(
+            f"Exported {count} {table} rows.",
+            file=discord.File(path, filename=f"{table}.{format}"),
+            ephemeral=True
+        )
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error exporting {table}: {e}")
+        await interaction.followup.send("Error exporting data. Please try again.", ephemeral=True)
+    finally:
+        os.remove(path)
+
+@bot.tree.command(name="import_data", description="Load players or matches from CSV/JSONL (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def import_data(interaction: discord.Interaction, table: Literal["players", "matches"], file: discord.Attachment):
+    fmt = os.path.splitext(file.filename)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl"):
+        await interaction.response.send_message("Attach a .csv or .jsonl file.", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        await file.save(path)
+        count = await asyncio.to_thread(dbtool.import_table_at, DB_PATH, table, path, fmt)
+    except (sqlite3.Error, OSError, ValueError, discord.HTTPException) as e:
+        print(f"Error importing {table}: {e}")
+        await interaction.followup.send(f"Error importing data, nothing was changed: {e}", ephemeral=True)
+        return
+    finally:
+        os.remove(path)
+    
+    if table == "players":
+        try:
+            player_cache.warm()
+        except sqlite3.Error as e:
+            print(f"Error warming player cache: {e}")
+        message = f"Imported {count} players."
+    else:
+        message = f"Imported {count} matches. Run `/recompute_ratings` and `/rebuild_stats` to fold them in."
+    await interaction.followup.send(message, ephemeral=True)
+
+@bot.tree.command(name="backup_db", description="Take an online backup of the database (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def backup_db(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, f"elo_bot-{datetime.now():%Y%m%d-%H%M%S}.db")
+    try:
+        await asyncio.to_thread(dbtool.backup_database, DB_PATH, path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error backing up database: {e}")
+        await interaction.followup.send("Error backing up database. Please try again.", ephemeral=True)
+        return
+    
+    await interaction.followup.send(f"Database backed up to `{path}`.", ephemeral=True)
+
+@bot.tree.command(name="maps", description="Show the map pool")
+async def maps(interaction: discord.Interaction):
+    try:
+        pool = bot.map_pool.pool(interaction.guild.id)
+    except sqlite3.Error as e:
+        print(f"Error loading map pool: {e}")
+        await interaction.response.send_message("Error loading map pool. Please try again.", ephemeral=True)
+        return
+    
+    total = sum(pool.values()) or 1
+    lines = [
+        f"{map_name} - weight {weight:g} ({weight / total * 100:.0f}%)"
+        for map_name, weight in sorted(pool.items(), key=lambda x: -x[1])
+    ]
+    embed = discord.Embed(title="🗺️ Map Pool", description="\n".join(lines), color=0x3498db)
+    embed.set_footer(text=f"Map selection: {bot.map_pool.selection_mode(interaction.guild.id)}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="map_set", description="Add a map or change its weight (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def map_set(interaction: discord.Interaction, name: str, weight: float = 1.0):
+    if weight <= 0:
+        await interaction.response.send_message("Weight must be greater than 0.", ephemeral=True)
+        return
+    
+    try:
+        bot.map_pool.set_weight(interaction.guild.id, name, weight)
+    except sqlite3.Error as e:
+        print(f"Error updating map pool: {e}")
+        await interaction.response.send_message("Error updating map pool. Please try again.", ephemeral=True)
+        return
+    
+    await interaction.response.send_message(f"{name} is in the map pool with weight {weight:g}.", ephemeral=True)
+
+@bot.tree.command(name="map_remove", description="Remove a map from the pool (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def map_remove(interaction: discord.Interaction, name: str):
+    try:
+        removed = bot.map_pool.remove(interaction.guild.id, name)
+    except sqlite3.Error as e:
+        print(f"Error updating map pool: {e}")
+        await interaction.response.send_message("Error updating map pool. Please try again.", ephemeral=True)
+        return
+    
+    message = f"Removed {name} from the map pool." if removed else f"{name} isn't in the map pool."
+    await interaction.response.send_message(message, ephemeral=True)
+
+@bot.tree.command(name="map_mode", description="Choose between map voting and instant selection (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def map_mode(interaction: discord.Interaction, mode: Literal["vote", "instant"]):
+    try:
+        bot.map_pool.set_selection_mode(interaction.guild.id, mode)
+    except sqlite3.Error as e:
+        print(f"Error saving map mode: {e}")
+        await interaction.response.send_message("Error saving map mode. Please try again.", ephemeral=True)
+        return
+    
+    await interaction.response.send_message(f"Map selection set to {mode}.", ephemeral=True)
+
+@bot.tree.command(name="party_invite", description="Invite a player to queue with you")
+async def party_invite(interaction: discord.Interaction, user: discord.Member):
+    parties = bot.parties
+    party_id = parties.party_of(interaction.user.id)
+    members = parties.members(party_id) if party_id else [interaction.user.id]
+    
+    if user.id == interaction.user.id or user.bot:
+        await interaction.response.send_message("You can't invite that user.", ephemeral=True)
+        return
+    if members[0] != interaction.user.id:
+        await interaction.response.send_message("Only your party leader can invite players.", ephemeral=True)
+        return
+    if len(members) >= MAX_PARTY_SIZE:
+        await interaction.response.send_message(f"Parties are limited to {MAX_PARTY_SIZE} players.", ephemeral=True)
+        return
+    if parties.party_of(user.id):
+        await interaction.response.send_message(f"{user.display_name} is already in a party.", ephemeral=True)
+        return
+    
+    await interaction.response.send_message(
+        f"{user.mention}, {interaction.user.mention} invited you to their party.",
+        view=PartyInviteView(bot, interaction.user, user)
+    )
+
+@bot.tree.command(name="party_leave", description="Leave your party")
+async def party_leave(interaction: discord.Interaction):
+    affected = bot.parties.remove(interaction.user.id)
+    if not affected:
+        await interaction.response.send_message("You're not in a party.", ephemeral=True)
+        return
+    
+    for user_id in affected:
+        bot.evict_member(user_id, "party changed")
+    await interaction.response.send_message("You left your party. Queued party members were removed from the queue.", ephemeral=True)
+
+@bot.tree.command(name="party", description="Show your party")
+async def party(interaction: discord.Interaction):
+    party_id = bot.parties.party_of(interaction.user.id)
+    if not party_id:
+        await interaction.response.send_message("You're not in a party. Use /party_invite to start one.", ephemeral=True)
+        return
+    
+    members = bot.parties.members(party_id)
+    lines = [f"<@{members[0]}> (leader)"] + [f"<@{p}>" for p in members[1:]]
+    embed = discord.Embed(title="👥 Your Party", description="\n".join(lines), color=0x3498db)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="match_log", description="Show a match's event timeline (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+async def match_log(interaction: discord.Interaction, match_id: int):
+    try:
+        events = await asyncio.to_thread(load_match_events, match_id)
+    except sqlite3.Error as e:
+        print(f"Error loading match events: {e}")
+        await interaction.response.send_message("Error loading match events. Please try again.", ephemeral=True)
+        return
+    
+    if not events:
+        await interaction.response.send_message(f"No events recorded for match {match_id}.", ephemeral=True)
+        return
+    
+    start = events[0][0]
+    lines = []
+    for created_at, event, user_id, data in events:
+        details = " ".join(f"{key}={value}" for key, value in json.loads(data).items()) if data else ""
+        by = f" <@{user_id}>" if user_id else ""
+        lines.append(f"`+{created_at - start:7.1f}s` **{event}**{by} {details}")
+    
+    embed = discord.Embed(
+        title=f"🧾 Match {match_id} Timeline",
+        description="\n".join(lines)[:4000],
+        color=0x3498db
+    )
+    embed.set_footer(text=f"{len(events)} events over {events[-1][0] - start:.0f}s")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @force_start.error
 @reset_elo.error
 @set_elo.error
+@end_season.error
+@bulk_adjust.error
+@revert_match_command.error
+@recompute_ratings_command.error
+@disputes.error
+@resolve_disputes_command.error
+@rebuild_stats_command.error
+@export_data.error
+@import_data.error
+@backup_db.error
+@map_set.error
+@map_remove.error
+@map_mode.error
+@match_log.error
 async def admin_command_error(interaction: discord.Interaction, error):
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
     if isinstance(error, app_commands.MissingPermissions):
-        await interaction.response.send_message("You don't have permission to use this command!", ephemeral=True)
+        await send("You don't have permission to use this command!", ephemeral=True)
     else:
-        await interaction.response.send_message(f"An error occurred: {str(error)}", ephemeral=True)
+        await send(f"An error occurred: {str(error)}", ephemeral=True)
         print(f"Command error: {error}")
 
 # Run the bot
@@ -0,0 +1,195 @@
+"""Export, import and back up the ELO bot database.
+
+    python dbtool.py export players players.csv
+    python dbtool.py export matches matches.jsonl --snapshot
+    python dbtool.py import players players.csv
+    python dbtool.py backup elo_bot-backup.db
+
+Exports stream rows in chunks, so memory stays flat however large the
+tables get. With --snapshot the export reads from an online backup
+instead of the live file and never holds a read transaction on it.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+DB_PATH = 'elo_bot.db'
+TRANSFER_TABLES = ("players", "matches")
+CHUNK_SIZE = 1000
+
+def table_columns(conn, table):
+    if table not in TRANSFER_TABLES:
+        raise ValueError(f"Unknown table {table!r}, expected one of {', '.join(TRANSFER_TABLES)}")
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def format_for(path, fmt=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format {fmt!r}, expected csv or jsonl")
+    return fmt
+
+def iter_rows(conn, table, columns, chunk_size=CHUNK_SIZE):
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid")
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+def export_table(conn, table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Stream a table into a CSV or JSONL file and return the row count"""
+    fmt = format_for(path, fmt)
+    columns = table_columns(conn, table)
+    count = 0
+
+    with open(path, "w", newline="", encoding="utf-8") as fp:
+        if fmt == "csv":
+            writer = csv.writer(fp)
+            writer.writerow(columns)
+            for row in iter_rows(conn, table, columns, chunk_size):
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in iter_rows(conn, table, columns, chunk_size):
+                fp.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+
+    return count
+
+def read_rows(fp, fmt):
+    """Yield dicts from a CSV or JSONL file; empty CSV cells become NULL"""
+    if fmt == "csv":
+        for row in csv.DictReader(fp):
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+    else:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+def import_table(conn, table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Load a CSV or JSONL file into a table in one transaction.
+
+    Rows replace existing ones with the same primary key. Columns that
+    the table doesn't have are ignored. Returns the row count.
+    """
+    fmt = format_for(path, fmt)
+    columns = table_columns(conn, table)
+    count = 0
+
+    with open(path, newline="", encoding="utf-8") as fp:
+        rows = read_rows(fp, fmt)
+        first = next(rows, None)
+        if first is None:
+            return 0
+
+        used = [col for col in columns if col in first]
+        query = f"INSERT OR REPLACE INTO {table} ({', '.join(used)}) VALUES ({', '.join('?' * len(used))})"
+
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            batch = [tuple(first.get(col) for col in used)]
+            for row in rows:
+                batch.append(tuple(row.get(col) for col in used))
+                if len(batch) >= chunk_size:
+                    c.executemany(query, batch)
+                    count += len(batch)
+                    batch = []
+            c.executemany(query, batch)
+            count += len(batch)
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+
+    return count
+
+def import_table_at(db_path, table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        return import_table(conn, table, path, fmt, chunk_size)
+    finally:
+        conn.close()
+
+def backup_database(src_path, dest_path):
+    """Copy a live database with the online backup API.
+
+    The copy is taken in a single step inside one read transaction. In WAL
+    mode writers carry on meanwhile, whereas a copy made a few pages at a
+    time restarts whenever another connection writes and may never finish.
+    """
+    src = sqlite3.connect(src_path, timeout=10)
+    dest = sqlite3.connect(dest_path)
+    try:
+        src.backup(dest, pages=-1)
+    finally:
+        dest.close()
+        src.close()
+
+@contextmanager
+def snapshot(src_path):
+    """Yield a connection to a temporary online backup of src_path"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    conn = None
+    try:
+        backup_database(src_path, path)
+        conn = sqlite3.connect(path)
+        yield conn
+    finally:
+        if conn:
+            conn.close()
+        os.remove(path)
+
+def export_snapshot(src_path, table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    with snapshot(src_path) as conn:
+        return export_table(conn, table, path, fmt, chunk_size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, import and back up the ELO bot database")
+    parser.add_argument("--db", default=DB_PATH, help=f"database file (default: {DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream a table to CSV or JSONL")
+    export_parser.add_argument("table", choices=TRANSFER_TABLES)
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"))
+    export_parser.add_argument("--snapshot", action="store_true", help="export from an online backup")
+
+    import_parser = commands.add_parser("import", help="load a CSV or JSONL file into a table")
+    import_parser.add_argument("table", choices=TRANSFER_TABLES)
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+
+    backup_parser = commands.add_parser("backup", help="copy the database with the online backup API")
+    backup_parser.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "backup":
+        backup_database(args.db, args.path)
+        print(f"Backed up {args.db} to {args.path}")
+        return
+
+    if args.command == "export":
+        if args.snapshot:
+            count = export_snapshot(args.db, args.table, args.path, args.format)
+        else:
+            conn = sqlite3.connect(args.db, timeout=10)
+            try:
+                count = export_table(conn, args.table, args.path, args.format)
+            finally:
+                conn.close()
+        print(f"Exported {count} {args.table} rows to {args.path}")
+        return
+
+    count = import_table_at(args.db, args.table, args.path, args.format)
+    print(f"Imported {count} {args.table} rows from {args.path}")
+
+if __name__ == "__main__":
+    main()
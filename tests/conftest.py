@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Point the bot at a fresh, fully migrated database"""
+    monkeypatch.setattr(bot, "DB_PATH", str(tmp_path / "elo_bot.db"))
+    bot.init_db()
+    return bot.DB_PATH
+
+
+def create_match(team_a, team_b, map_played="Dust II"):
+    with bot.get_db_cursor() as c:
+        c.execute(
+            "INSERT INTO matches (team_a_players, team_b_players, map_played) VALUES (?, ?, ?)",
+            (",".join(map(str, team_a)), ",".join(map(str, team_b)), map_played)
+        )
+        return c.lastrowid
+
+
+def player_ratings(user_ids):
+    with bot.get_db_cursor() as c:
+        c.execute(
+            f"SELECT user_id, elo, wins, losses FROM players WHERE user_id IN ({','.join('?' * len(user_ids))})",
+            user_ids
+        )
+        return {row[0]: row[1:] for row in c.fetchall()}
+
+
+class FakeResponse:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.messages.append(content)
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+    def __str__(self):
+        return f"player{self.id}"
+
+
+class FakeInteraction:
+    """The parts of a discord.Interaction that views touch outside a guild"""
+
+    def __init__(self, user_id):
+        self.user = FakeUser(user_id)
+        self.guild = None
+        self.response = FakeResponse()
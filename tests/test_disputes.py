@@ -0,0 +1,82 @@
+import bot
+from conftest import create_match, player_ratings
+
+TEAM_A = [1, 2]
+TEAM_B = [3, 4]
+
+
+def dispute(match_id):
+    with bot.get_db_cursor() as c:
+        c.execute("UPDATE matches SET disputed=1 WHERE match_id=?", (match_id,))
+
+
+def test_voided_match_cannot_be_settled(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    dispute(match_id)
+
+    results = bot.resolve_disputes([(match_id, "void")])
+    assert results[0][1] == "void"
+
+    # A late "Team A Won" click from the still-live match channel
+    with bot.get_db_cursor() as c:
+        assert bot.settle_match(c, match_id, "A", TEAM_A, TEAM_B) is None
+
+    assert player_ratings(TEAM_A + TEAM_B) == {}
+    with bot.get_db_cursor() as c:
+        c.execute("SELECT winning_team, voided FROM matches WHERE match_id=?", (match_id,))
+        assert c.fetchone() == (None, 1)
+
+
+def test_reverted_unsettled_match_cannot_be_settled(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    assert bot.revert_match(match_id) == []
+
+    with bot.get_db_cursor() as c:
+        assert bot.settle_match(c, match_id, "B", TEAM_A, TEAM_B) is None
+    assert player_ratings(TEAM_A + TEAM_B) == {}
+
+
+def test_resolved_dispute_settles_once(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    dispute(match_id)
+
+    results = bot.resolve_disputes([(match_id, "B")])
+    assert results[0][4] is not None
+
+    with bot.get_db_cursor() as c:
+        assert bot.settle_match(c, match_id, "A", TEAM_A, TEAM_B) is None
+    ratings = player_ratings(TEAM_A + TEAM_B)
+    assert ratings[3] == (bot.ELO_CHANGE, 1, 0)
+    assert ratings[1] == (-bot.ELO_CHANGE, 0, 1)
+
+
+def test_resolution_returns_what_to_clean_up(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    dispute(match_id)
+    with bot.get_db_cursor() as c:
+        c.execute(
+            """UPDATE matches SET match_channel_id=11, team_a_channel_id=12, team_b_channel_id=13,
+                                  dispute_message_id=99 WHERE match_id=?""",
+            (match_id,)
+        )
+
+    names = {p: f"player{p}" for p in bot.load_dispute_rosters([match_id])}
+    assert sorted(names) == TEAM_A + TEAM_B
+
+    (result,) = bot.resolve_disputes([(match_id, "A")], names=names)
+    assert result[1] == "A"
+    assert result[5:] == ([11, 12, 13], 99)
+
+    (again,) = bot.resolve_disputes([(match_id, "A")], names=names)
+    assert again[1] == "skipped" and again[5:] == ([], None)
+
+
+def test_dispute_page_is_clamped(db):
+    for _ in range(bot.DISPUTES_PER_PAGE + 1):
+        dispute(create_match(TEAM_A, TEAM_B))
+
+    total, page, rows = bot.load_open_disputes(5)
+    assert (total, page, len(rows)) == (bot.DISPUTES_PER_PAGE + 1, 2, 1)
+
+    total, page, rows = bot.load_open_disputes(0)
+    assert (page, len(rows)) == (1, bot.DISPUTES_PER_PAGE)
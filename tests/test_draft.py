@@ -0,0 +1,32 @@
+import bot
+
+
+def test_snake_order_alternates_in_pairs():
+    assert bot.draft_order(6, "snake") == [0, 1, 1, 0, 0, 1]
+    assert bot.draft_order(4, "alternate") == [0, 1, 0, 1]
+
+
+def test_pick_out_of_turn_is_rejected():
+    engine = bot.DraftEngine([1, 2], [3, 4, 5, 6], mode="snake")
+
+    assert not engine.pick(2, 3)
+    assert not engine.pick(1, 99)
+    assert engine.pick(1, 3)
+    # Snake order: captain B picks twice in a row
+    assert not engine.pick(1, 4)
+    assert engine.pick(2, 4)
+    assert engine.pick(2, 5)
+    assert engine.pick(1, 6)
+
+    assert engine.complete
+    assert engine.teams == ([1, 3, 6], [2, 4, 5])
+    assert not engine.pick(1, 6)
+
+
+def test_auto_pick_takes_highest_rated():
+    engine = bot.DraftEngine([1, 2], [3, 4, 5], ratings={3: 100, 4: 300, 5: 200})
+
+    assert engine.auto_pick() == 4
+    assert engine.current_captain == 2
+    assert engine.auto_pick() == 5
+    assert engine.history == [(0, 4, True), (1, 5, True)]
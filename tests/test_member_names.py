@@ -0,0 +1,72 @@
+import asyncio
+
+import bot
+from conftest import create_match
+
+
+class FakeMember:
+    def __init__(self, user_id, guild):
+        self.id = user_id
+        self.guild = guild
+
+    def __str__(self):
+        return f"member{self.id}"
+
+
+class FakeGuild:
+    """A guild whose gateway cache is empty, as with voice-only member caching"""
+
+    id = 1
+
+    def __init__(self):
+        self.fetches = []
+
+    def get_member(self, user_id):
+        return None
+
+    async def fetch_member(self, user_id):
+        self.fetches.append(user_id)
+        return FakeMember(user_id, self)
+
+
+def test_settlement_stores_fetched_names(db, monkeypatch):
+    monkeypatch.setattr(bot.bot, "members", bot.MemberLookup())
+    guild = FakeGuild()
+    match_id = create_match([1, 2], [3, 4])
+
+    async def scenario():
+        return await bot.bot.members.display_names(guild, [1, 2, 3, 4])
+
+    names = asyncio.run(scenario())
+    with bot.get_db_cursor() as c:
+        bot.settle_match(c, match_id, "A", [1, 2], [3, 4], guild, names)
+        c.execute("SELECT username FROM players ORDER BY user_id")
+        assert [row[0] for row in c.fetchall()] == ["member1", "member2", "member3", "member4"]
+
+
+def test_display_names_fetch_each_member_once(db, monkeypatch):
+    monkeypatch.setattr(bot.bot, "members", bot.MemberLookup())
+    guild = FakeGuild()
+
+    async def scenario():
+        await bot.bot.members.display_names(guild, [7, 8])
+        return await bot.bot.members.display_names(guild, [7, 8])
+
+    assert asyncio.run(scenario()) == {7: "member7", 8: "member8"}
+    assert guild.fetches == [7, 8]
+    # Later lookups without API calls see the fetched members too
+    assert bot.player_display_name(guild, 7) == "member7"
+
+
+def test_fresh_member_bypasses_fetch_cache(db, monkeypatch):
+    monkeypatch.setattr(bot.bot, "members", bot.MemberLookup())
+    guild = FakeGuild()
+
+    async def scenario():
+        await bot.bot.members.get(guild, 7)
+        await bot.bot.members.get(guild, 7)
+        # Role edits need the member's current roles, not the cached snapshot
+        return await bot.bot.members.fresh(guild, 7)
+
+    assert str(asyncio.run(scenario())) == "member7"
+    assert guild.fetches == [7, 7]
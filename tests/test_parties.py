@@ -0,0 +1,36 @@
+import bot
+
+
+def units(*sizes):
+    """Queue units of the given sizes, with player IDs numbered in join order"""
+    result, next_id = [], 1
+    for size in sizes:
+        result.append([(p, f"player{p}") for p in range(next_id, next_id + size)])
+        next_id += size
+    return result
+
+
+def ids(team):
+    return [p[0] for p in team]
+
+
+def test_solo_players_fill_teams_in_join_order():
+    team_a, team_b = bot.pack_parties(units(1, 1, 1, 1, 1), 2)
+    assert sorted(ids(team_a) + ids(team_b)) == [1, 2, 3, 4]
+
+
+def test_parties_are_never_split():
+    # A party of 3 and a party of 2 can't share a 4-player team with each other
+    team_a, team_b = bot.pack_parties(units(3, 2, 1, 2), 4)
+    teams = sorted([ids(team_a), ids(team_b)])
+    assert teams == [[1, 2, 3, 6], [4, 5, 7, 8]]
+
+
+def test_no_fit_returns_none():
+    assert bot.pack_parties(units(3, 3), 4) is None
+    assert bot.pack_parties(units(2, 1), 2) is None
+
+
+def test_group_queue_units_keeps_join_order():
+    rows = [(1, "a", None), (2, "b", 7), (3, "c", None), (4, "d", 7)]
+    assert bot.group_queue_units(rows) == [[(1, "a")], [(2, "b"), (4, "d")], [(3, "c")]]
@@ -0,0 +1,44 @@
+import pytest
+
+import bot
+
+# Queries run on every queue click, leaderboard, profile, pop or settlement
+HOT_QUERIES = [
+    ("queue board", "SELECT username, party_id FROM queue WHERE queue_type=? ORDER BY joined_at", ("2v2",)),
+    ("queue pick", "SELECT user_id, username, party_id FROM queue WHERE queue_type=? ORDER BY joined_at, rowid", ("2v2",)),
+    ("queue leave", "DELETE FROM queue WHERE user_id=? AND queue_type=?", (1, "2v2")),
+    ("queue pop", "DELETE FROM queue WHERE user_id IN (?, ?)", (1, 2)),
+    ("leaderboard", "SELECT username, elo, wins, losses FROM players ORDER BY elo DESC LIMIT 10", ()),
+    ("player lookup", "SELECT user_id, elo FROM players WHERE user_id IN (?, ?)", (1, 2)),
+    ("season leaderboard",
+     "SELECT username, elo, wins, losses FROM season_ratings WHERE season_id=? ORDER BY elo DESC LIMIT 10", (1,)),
+    ("season profile", "SELECT elo, wins, losses FROM season_ratings WHERE season_id=? AND user_id=?", (1, 1)),
+    ("settlement claim",
+     "UPDATE matches SET winning_team=? WHERE match_id=? AND winning_team IS NULL AND voided=0", ("A", 1)),
+    ("open disputes",
+     f"SELECT match_id FROM matches WHERE {bot.OPEN_DISPUTES_WHERE} ORDER BY match_id LIMIT 10", ()),
+    ("replay season",
+     "SELECT match_id FROM matches WHERE winning_team IN ('A', 'B') AND voided=0 AND season_id=? "
+     "ORDER BY timestamp, match_id", (1,)),
+    ("profile streak", "SELECT current_streak FROM player_streaks WHERE user_id=?", (1,)),
+    ("profile maps", "SELECT map, wins, losses FROM player_map_stats WHERE user_id=? ORDER BY wins + losses DESC LIMIT 5", (1,)),
+    ("profile teammates",
+     "SELECT teammate_id, games, wins FROM teammate_pairs WHERE user_id=? AND games > 0 ORDER BY games DESC LIMIT 5", (1,)),
+    ("map pool", "SELECT map, weight FROM map_pool WHERE guild_id=?", (1,)),
+    ("recent maps",
+     "SELECT map, COUNT(*) FROM player_recent_maps WHERE user_id IN (?, ?) AND played_at >= datetime('now', ?) GROUP BY map",
+     (1, 2, "-24 hours")),
+    ("match log", "SELECT event FROM match_events WHERE match_id=?", (1,)),
+]
+
+
+@pytest.mark.parametrize("name, query, params", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(db, name, query, params):
+    with bot.get_db_cursor() as c:
+        c.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        steps = [row[3] for row in c.fetchall()]
+
+    table_steps = [step for step in steps if step.startswith(("SCAN", "SEARCH"))]
+    assert table_steps, steps
+    for step in table_steps:
+        assert "USING" in step, f"{name} reads a table without an index: {steps}"
@@ -0,0 +1,68 @@
+import asyncio
+
+import bot
+
+
+class FakeMessage:
+    def __init__(self, message_id, delay=0):
+        self.id = message_id
+        self.delay = delay
+        self.edits = []
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.edits.append(kwargs)
+
+
+class FakeView:
+    def __init__(self, queue_type, message):
+        self.queue_type = queue_type
+        self.queue_message = message
+
+    def stop(self):
+        pass
+
+
+def join(user_id, queue_type="2v2"):
+    with bot.get_db_cursor() as c:
+        c.execute(
+            "INSERT INTO queue (user_id, username, queue_type, joined_at) VALUES (?, ?, ?, ?)",
+            (user_id, f"player{user_id}", queue_type, float(user_id))
+        )
+
+
+def status(message):
+    return message.edits[-1]["embed"].description
+
+
+def test_mark_during_slow_edit_is_not_lost(db):
+    async def scenario():
+        boards = bot.QueueBoards()
+        message = FakeMessage(1, delay=0.2)
+        await boards.track(1, FakeView("2v2", message))
+
+        join(10)
+        boards.mark(["2v2"])
+        await asyncio.sleep(0.05)
+        # Second join lands while the first redraw is still being sent
+        join(11)
+        boards.mark(["2v2"])
+        await asyncio.sleep(0.6)
+        return boards, message
+
+    boards, message = asyncio.run(scenario())
+    assert "2/4" in status(message)
+    assert not boards._dirty
+
+
+def test_unchanged_render_skips_edits(db):
+    async def scenario():
+        boards = bot.QueueBoards()
+        message = FakeMessage(1)
+        await boards.track(1, FakeView("2v2", message))
+        boards.mark(["2v2"])
+        boards.mark(["2v2"])
+        await asyncio.sleep(0.05)
+        return message
+
+    assert len(asyncio.run(scenario()).edits) == 1
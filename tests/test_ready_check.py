@@ -0,0 +1,119 @@
+import asyncio
+
+import bot
+from conftest import FakeInteraction
+
+
+def queue_players(user_ids, queue_type="2v2"):
+    with bot.get_db_cursor() as c:
+        c.executemany(
+            "INSERT INTO queue (user_id, username, queue_type, joined_at) VALUES (?, ?, ?, ?)",
+            [(p, f"player{p}", queue_type, float(p)) for p in user_ids]
+        )
+
+
+def pop(player_ids):
+    with bot.get_db_cursor() as c:
+        c.executemany("DELETE FROM queue WHERE user_id=?", [(p,) for p in player_ids])
+    return True
+
+
+def test_only_ready_checked_players_are_popped(db):
+    queue_players([1, 2, 3, 4])
+    checks, started = [], []
+
+    async def scenario():
+        view = bot.MatchmakingView(bot.bot, "2v2")
+
+        async def ready_check(interaction, player_ids):
+            checks.append(list(player_ids))
+            # Player 2 never clicks Ready
+            not_ready = [p for p in player_ids if p == 2]
+            bot.evict_queue_entries([(p, "2v2") for p in not_ready], "not ready")
+            return {p for p in player_ids if p not in not_ready}
+
+        async def start_match(interaction, player_ids=None, ready_check_time=None):
+            started.append(player_ids)
+            return pop(player_ids)
+
+        view.ready_check = ready_check
+        view.start_match = start_match
+        await view.join_queue.callback(FakeInteraction(5))
+
+    asyncio.run(scenario())
+    # The replacement for player 2 is checked on their own before the pop
+    assert checks == [[1, 2, 3, 4], [5]]
+    assert started == [[1, 3, 4, 5]]
+
+
+def test_pick_is_limited_to_confirmed_players(db):
+    queue_players([1, 2, 3, 4, 5])
+
+    async def scenario():
+        view = bot.MatchmakingView(bot.bot, "2v2")
+        with bot.get_db_cursor() as c:
+            return view.pick_match(c, {1, 3, 4, 5}), view.pick_match(c, {1, 3, 4})
+
+    confirmed, short = asyncio.run(scenario())
+    assert sorted(p[0] for p in confirmed[0]) == [1, 3, 4, 5]
+    assert short is None
+
+
+def test_queue_refilled_during_check_pops_again(db):
+    queue_players([1, 2, 3])
+    checks, started, timings = [], [], []
+
+    async def scenario():
+        view = bot.MatchmakingView(bot.bot, "2v2")
+
+        async def ready_check(interaction, player_ids):
+            checks.append(list(player_ids))
+            if len(checks) == 1:
+                # Four more players join while the first check runs; their
+                # own joins see the running check and leave the pop to us
+                queue_players([5, 6, 7, 8])
+            return set(player_ids)
+
+        async def start_match(interaction, player_ids=None, ready_check_time=None):
+            started.append(player_ids)
+            timings.append(ready_check_time)
+            return pop(player_ids)
+
+        view.ready_check = ready_check
+        view.start_match = start_match
+        await view.join_queue.callback(FakeInteraction(4))
+
+    asyncio.run(scenario())
+    # Each pop is logged with the time its own ready check took
+    assert all(t is not None and 0 <= t < 1 for t in timings)
+    assert checks == [[1, 2, 3, 4], [5, 6, 7, 8]]
+    assert started == [[1, 2, 3, 4], [5, 6, 7, 8]]
+
+
+def test_failed_pop_is_retried_with_remaining_players(db):
+    queue_players([1, 2, 3, 5])
+    checks, started = [], []
+
+    async def scenario():
+        view = bot.MatchmakingView(bot.bot, "2v2")
+
+        async def ready_check(interaction, player_ids):
+            checks.append(list(player_ids))
+            return set(player_ids)
+
+        async def start_match(interaction, player_ids=None, ready_check_time=None):
+            started.append(player_ids)
+            if len(started) == 1:
+                # Player 2 was popped by another queue's match meanwhile
+                pop([2])
+                return False
+            return pop(player_ids)
+
+        view.ready_check = ready_check
+        view.start_match = start_match
+        await view.join_queue.callback(FakeInteraction(4))
+
+    asyncio.run(scenario())
+    # Confirmed players aren't asked again; only the joining player is new to the pick
+    assert checks == [[1, 2, 3, 5], [4]]
+    assert started == [[1, 2, 3, 5], [1, 3, 5, 4]]
@@ -0,0 +1,52 @@
+import pytest
+
+import bot
+from conftest import create_match, player_ratings
+
+TEAM_A = [1, 2]
+TEAM_B = [3, 4]
+
+
+def test_result_settled_after_rollover_counts_toward_new_season(db):
+    with bot.get_db_cursor() as c:
+        old_season, _ = bot.get_current_season(c)
+    match_id = create_match(TEAM_A, TEAM_B)
+    with bot.get_db_cursor() as c:
+        c.execute("UPDATE matches SET timestamp='2000-01-01 00:00:00' WHERE match_id=?", (match_id,))
+
+    bot.rollover_season()
+    with bot.get_db_cursor() as c:
+        new_season, _ = bot.get_current_season(c)
+        assert bot.settle_match(c, match_id, "A", TEAM_A, TEAM_B) is not None
+        c.execute("SELECT season_id FROM matches WHERE match_id=?", (match_id,))
+        assert c.fetchone()[0] == new_season != old_season
+
+    # The replay must include the result, so there is nothing to correct
+    assert bot.recompute_ratings() == []
+
+
+def test_past_season_match_cannot_be_reverted(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    with bot.get_db_cursor() as c:
+        bot.settle_match(c, match_id, "A", TEAM_A, TEAM_B)
+
+    bot.rollover_season()
+    before = player_ratings(TEAM_A + TEAM_B)
+    with pytest.raises(ValueError):
+        bot.revert_match(match_id)
+
+    assert player_ratings(TEAM_A + TEAM_B) == before
+    with bot.get_db_cursor() as c:
+        c.execute("SELECT voided FROM matches WHERE match_id=?", (match_id,))
+        assert c.fetchone()[0] == 0
+    assert bot.recompute_ratings() == []
+
+
+def test_current_season_match_can_be_reverted(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    with bot.get_db_cursor() as c:
+        bot.settle_match(c, match_id, "A", TEAM_A, TEAM_B)
+
+    changes = bot.revert_match(match_id)
+    assert len(changes) == 4
+    assert all(ratings[1:] == (0, 0) for ratings in player_ratings(TEAM_A + TEAM_B).values())
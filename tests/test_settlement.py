@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import bot
+from conftest import FakeInteraction, create_match, player_ratings
+
+TEAM_A = [1, 2]
+TEAM_B = [3, 4]
+CLICKS = 10
+
+
+def test_concurrent_settlements_apply_once(db):
+    match_id = create_match(TEAM_A, TEAM_B)
+    barrier = threading.Barrier(CLICKS)
+    results = []
+
+    def settle(click):
+        barrier.wait()
+        with bot.get_db_cursor() as c:
+            results.append(bot.settle_match(c, match_id, "AB"[click % 2], TEAM_A, TEAM_B))
+
+    threads = [threading.Thread(target=settle, args=(click,)) for click in range(CLICKS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    settled = [result for result in results if result is not None]
+    assert len(results) == CLICKS
+    assert len(settled) == 1
+
+    delta = settled[0][0]
+    with bot.get_db_cursor() as c:
+        c.execute("SELECT winning_team, elo_change FROM matches WHERE match_id=?", (match_id,))
+        winning_team, elo_change = c.fetchone()
+    assert elo_change == delta
+
+    winners, losers = (TEAM_A, TEAM_B) if winning_team == "A" else (TEAM_B, TEAM_A)
+    ratings = player_ratings(TEAM_A + TEAM_B)
+    assert all(ratings[p] == (delta, 1, 0) for p in winners)
+    assert all(ratings[p] == (-delta, 0, 1) for p in losers)
+
+
+def test_concurrent_result_clicks_share_one_settlement(db, monkeypatch):
+    monkeypatch.setattr(bot.bot, "settlements", bot.SettlementLedger())
+    match_id = create_match(TEAM_A, TEAM_B)
+    finished = []
+
+    async def scenario():
+        view = bot.MatchResultView(bot.bot, match_id, TEAM_A, TEAM_B, None, None, None)
+
+        async def finish_settlement(interaction, winning_team, settlement):
+            finished.append((winning_team, settlement[0]))
+            await interaction.response.send_message(f"Recorded {winning_team}")
+
+        view.finish_settlement = finish_settlement
+        clicks = [FakeInteraction((TEAM_A + TEAM_B)[i % 4]) for i in range(CLICKS)]
+        await asyncio.gather(*(view.process_result(click, "AB"[i % 2]) for i, click in enumerate(clicks)))
+        return clicks
+
+    clicks = asyncio.run(scenario())
+    assert len(finished) == 1
+    winning_team, delta = finished[0]
+
+    replies = [reply for click in clicks for reply in click.response.messages]
+    assert len(replies) == CLICKS
+    assert replies.count(f"Recorded {winning_team}") == 1
+    assert replies.count(f"Result already recorded! Team {winning_team} won.") == CLICKS - 1
+    assert bot.bot.settlements.winner(match_id) == winning_team
+
+    ratings = player_ratings(TEAM_A + TEAM_B)
+    assert sorted(elo for elo, _, _ in ratings.values()) == [-delta, -delta, delta, delta]
@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+import time
+
+import bot
+from conftest import create_match
+
+
+def settle(match_id, winning_team, team_a, team_b):
+    with bot.get_db_cursor() as c:
+        assert bot.settle_match(c, match_id, winning_team, team_a, team_b) is not None
+
+
+def stats_tables():
+    with bot.get_db_cursor() as c:
+        tables = {}
+        for table in ("player_map_stats", "teammate_pairs", "player_streaks"):
+            c.execute(f"SELECT * FROM {table} ORDER BY 1, 2")
+            tables[table] = c.fetchall()
+        return tables
+
+
+def play_matches(count):
+    for i in range(count):
+        team_a, team_b = [1, 2 + i % 3], [5, 6]
+        settle(create_match(team_a, team_b, ("Dust II", "Mirage")[i % 2]), "AB"[i % 3 == 0], team_a, team_b)
+
+
+def test_rebuild_matches_incremental_stats(db):
+    play_matches(12)
+    incremental = stats_tables()
+
+    bot.rebuild_stats()
+    assert stats_tables() == incremental
+
+
+def test_rebuild_does_not_block_writers(db, monkeypatch):
+    play_matches(3)
+    real_aggregate = bot.aggregate_match_stats
+    aggregating = threading.Event()
+
+    def slow_aggregate(conn):
+        aggregating.set()
+        time.sleep(0.5)
+        return real_aggregate(conn)
+
+    monkeypatch.setattr(bot, "aggregate_match_stats", slow_aggregate)
+    rebuild = threading.Thread(target=bot.rebuild_stats)
+    rebuild.start()
+    aggregating.wait()
+
+    conn = sqlite3.connect(bot.DB_PATH, timeout=0.1)
+    conn.execute("INSERT INTO queue (user_id, username, queue_type, joined_at) VALUES (99, 'p', '2v2', 0)")
+    conn.commit()
+    conn.close()
+    rebuild.join()
+
+
+def test_rebuild_retries_when_a_match_settles_mid_read(db, monkeypatch):
+    play_matches(3)
+    real_aggregate = bot.aggregate_match_stats
+    calls = []
+
+    def aggregate_then_settle(conn):
+        result = real_aggregate(conn)
+        if not calls:
+            settle(create_match([7], [8]), "A", [7], [8])
+        calls.append(1)
+        return result
+
+    monkeypatch.setattr(bot, "aggregate_match_stats", aggregate_then_settle)
+    bot.rebuild_stats()
+    assert len(calls) == 2
+    assert (7, 1, 1, 0) in stats_tables()["player_streaks"]
+
+
+def test_revert_matches_rebuilt_stats(db):
+    play_matches(12)
+    with bot.get_db_cursor() as c:
+        c.execute("SELECT match_id FROM matches ORDER BY match_id DESC LIMIT 1 OFFSET 2")
+        match_id = c.fetchone()[0]
+
+    bot.revert_match(match_id)
+    reverted = stats_tables()
+
+    bot.rebuild_stats()
+    assert stats_tables() == reverted
+
+
+def test_revert_drops_emptied_stats(db):
+    match_id = create_match([1], [2])
+    settle(match_id, "A", [1], [2])
+    bot.revert_match(match_id)
+
+    tables = stats_tables()
+    assert tables["player_map_stats"] == []
+    assert tables["player_streaks"] == [(1, 0, 0, 0), (2, 0, 0, 0)]
+    assert bot.load_player_stats(1)[1] == []
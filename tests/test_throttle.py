@@ -0,0 +1,36 @@
+import bot
+
+RATES = {"join_queue": (2, 0.5)}
+
+
+def test_burst_then_refill():
+    throttle = bot.Throttle(RATES, default=(1, 1.0))
+
+    assert throttle.allow(1, "join_queue", now=100)
+    assert throttle.allow(1, "join_queue", now=100)
+    assert not throttle.allow(1, "join_queue", now=100)
+    # Half a token per second
+    assert not throttle.allow(1, "join_queue", now=101)
+    assert throttle.allow(1, "join_queue", now=102)
+
+
+def test_buckets_are_per_user_and_action():
+    throttle = bot.Throttle(RATES, default=(1, 1.0))
+
+    assert throttle.allow(1, "other", now=100)
+    assert not throttle.allow(1, "other", now=100)
+    assert throttle.allow(2, "other", now=100)
+    assert throttle.allow(1, "join_queue", now=100)
+
+
+def test_sweep_drops_only_refilled_buckets():
+    throttle = bot.Throttle(RATES, default=(1, 1.0))
+    throttle.allow(1, "join_queue", now=100)
+    throttle.allow(2, "other", now=100)
+
+    assert throttle.sweep(now=101) == 1
+    assert throttle.sweep(now=102) == 1
+    assert throttle.sweep(now=200) == 0
+    # A swept bucket starts full again
+    assert throttle.allow(1, "join_queue", now=200)
+    assert throttle.allow(1, "join_queue", now=200)